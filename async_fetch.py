@@ -0,0 +1,109 @@
+import asyncio
+import inspect
+import random
+from collections import namedtuple
+
+
+# The result of fetching one ticker. data is None and error is the exception if
+# the ticker couldn't be fetched (after every retry, if its error was one to retry).
+FetchResult = namedtuple('FetchResult', ['ticker', 'data', 'error'])
+
+
+# Raised when a download gives back no candles, which yfinance does instead of
+# raising when a download fails (like when it's rate limited), so it gets retried.
+class EmptyDownloadError(Exception):
+    pass
+
+
+# Downloads one ticker into a dataframe like get_stock_data()'s.
+# yf.download() keeps its results and errors in module level state that every call
+# shares, so calls running in several threads at once can get each other's data.
+# A yf.Ticker only keeps its own ticker's data, so it's safe to use in a thread.
+def _download_ticker(ticker, start_date, end_date):
+    import yfinance as yf
+    import stoks
+
+    data = yf.Ticker(ticker).history(start=start_date, end=end_date, auto_adjust=False)
+    if (data is None or len(data.index) == 0):
+        raise EmptyDownloadError(f'no candles were downloaded for {ticker} from {start_date} to {end_date}')
+    # history() gives dates in the exchange's time zone, but yf.download() (and so
+    # the rest of the code) uses plain dates.
+    data.index = data.index.tz_localize(None)
+    return stoks.stock_frame(data)
+
+
+# The default download, which blocks, so it's run in a thread.
+async def _default_download(ticker, start_date, end_date):
+    return await asyncio.to_thread(_download_ticker, ticker, start_date, end_date)
+
+
+# Wraps download so it can always be awaited, running it in a thread if it's a
+# normal function instead of a coroutine function.
+def _as_coroutine(download):
+    if (inspect.iscoroutinefunction(download)):
+        return download
+
+    async def wrapped(ticker, start_date, end_date):
+        return await asyncio.to_thread(download, ticker, start_date, end_date)
+    return wrapped
+
+
+# Fetches one ticker, retrying with a growing wait in between if it fails with one
+# of the errors in retry_on (like when the server is rate limiting us). Any other
+# error is returned in the FetchResult right away, without retrying, so one bad
+# ticker doesn't stop the others.
+async def _fetch_one(download, semaphore, ticker, start_date, end_date, retries, backoff, retry_on):
+    for attempt in range(retries + 1):
+        # Only concurrency downloads run at once. The wait between retries happens
+        # outside of this so it doesn't hold up other tickers.
+        async with semaphore:
+            try:
+                return FetchResult(ticker, await download(ticker, start_date, end_date), None)
+            except retry_on as err:
+                error = err
+            except Exception as err:
+                return FetchResult(ticker, None, err)
+
+        if (attempt < retries):
+            # Waits backoff, 2*backoff, 4*backoff... seconds, plus up to 10% extra so
+            # the retries don't all hit the server at the same moment.
+            delay = backoff * 2**attempt
+            await asyncio.sleep(delay + random.uniform(0, delay / 10))
+
+    return FetchResult(ticker, None, error)
+
+
+# Fetches many tickers at once and yields a FetchResult for each one as soon as
+# it's done (not in the order they were given).
+# download is called as download(ticker, start_date, end_date) and returns a
+# dataframe like get_stock_data(). It can be a coroutine function or a normal
+# function (which is run in a thread), and defaults to downloading the ticker with
+# yfinance in a way that's safe to run in several threads at once. The default
+# raises EmptyDownloadError when nothing is downloaded (which is how yfinance
+# reports most failures), so a date range with no candles at all is retried too.
+# At most concurrency downloads run at the same time. A failed download is retried
+# up to retries times only if its error is one of retry_on; other errors are
+# yielded in their ticker's FetchResult without retrying.
+async def fetch_many(tickers, start_date, end_date, download=None, concurrency=8,
+                     retries=3, backoff=1.0, retry_on=(Exception,)):
+    download = _default_download if download is None else _as_coroutine(download)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    tasks = [asyncio.create_task(_fetch_one(download, semaphore, ticker, start_date, end_date,
+                                            retries, backoff, retry_on))
+             for ticker in dict.fromkeys(tickers)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        # Stops the downloads that are left if the caller stops early.
+        for task in tasks:
+            task.cancel()
+
+
+# Fetches many tickers at once from normal (not async) code.
+# Returns a dict of ticker to FetchResult.
+def load_many(tickers, start_date, end_date, **kwargs):
+    async def collect():
+        return {result.ticker: result async for result in fetch_many(tickers, start_date, end_date, **kwargs)}
+    return asyncio.run(collect())
@@ -0,0 +1,118 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import stoks
+from stock_cache import StockCache
+
+
+# The strats that are run on every ticker, in the order they're printed.
+STRAT_NAMES = ['bullish_engulfing', 'piercing', 'hammer',
+               'bearish_engulfing', 'dark_cloud_cover', 'shooting_star']
+
+
+# Loads the data on one ticker and finds the success rate of every strat.
+# A strat that never occurs gets a success rate of nan instead of raising a
+# ZeroDivisionError, and if the ticker can't be loaded or scanned its error is
+# recorded instead of stopping the batch.
+# Returns the row of results and the ticker's EventTable (None if it failed).
+def run_ticker(ticker, start_date, end_date, cache_dir=None, fetcher=None):
+    row = {'Ticker': ticker}
+    try:
+        if (cache_dir is not None):
+            stock_data = stoks.get_stock_data(ticker, start_date, end_date,
+                                              cache=StockCache(cache_dir, fetcher))
+        elif (fetcher is not None):
+            stock_data = fetcher(ticker, start_date, end_date)
+        else:
+            stock_data = stoks.get_stock_data(ticker, start_date, end_date)
+
+        ema = stoks.ema(stock_data)
+        row['Candles'] = len(stock_data.index)
+
+        # Every strat is found in one sweep over the data.
+        result = stoks.scan(stock_data, ema, STRAT_NAMES, ticker)
+        rates = {}
+        for name in STRAT_NAMES:
+            try:
+                rates[name] = result.succ_rate(name)
+            except ZeroDivisionError:
+                # The strat never occurred.
+                rates[name] = np.nan
+    except Exception as err:
+        row['Error'] = f'{type(err).__name__}: {err}'
+        return row, None
+
+    row.update(rates)
+    return row, result.events
+
+
+# Runs every strat on every ticker, spread across a pool of processes.
+# Returns a dataframe with a row per ticker and a column per strat's success rate,
+# plus the number of candles and any error that stopped a ticker from loading or
+# being scanned.
+# fetcher (which must be a top level function so it can be sent to the other
+# processes) replaces get_stock_data() if given, and cache_dir caches the data.
+# If return_events is True, an EventTable with every strat on every ticker is
+# returned too.
+def run_batch(tickers, start_date, end_date, workers=None, cache_dir=None, fetcher=None,
+              return_events=False):
+    # Skips repeated tickers but keeps them in order.
+    tickers = list(dict.fromkeys(tickers))
+
+    if (workers == 1):
+        outputs = [run_ticker(ticker, start_date, end_date, cache_dir, fetcher) for ticker in tickers]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(run_ticker, tickers,
+                                 [start_date] * len(tickers), [end_date] * len(tickers),
+                                 [cache_dir] * len(tickers), [fetcher] * len(tickers)))
+
+    rows = [row for row, events in outputs]
+    results = pd.DataFrame(rows, columns=['Ticker', 'Candles'] + STRAT_NAMES + ['Error']).set_index('Ticker')
+
+    if (return_events):
+        return results, stoks.EventTable.concat(events for row, events in outputs if events is not None)
+    return results
+
+
+# Reads tickers from a file, one per line. Blank lines and lines starting with # are skipped.
+def read_tickers(path):
+    with open(path) as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Finds the success rate of every strat on many tickers.')
+    parser.add_argument('tickers', nargs='*', help='tickers to run, like TSLA AAPL')
+    parser.add_argument('-f', '--file', help='a file with one ticker per line')
+    parser.add_argument('-s', '--start', default='2010-01-01', help='start date (default: %(default)s)')
+    parser.add_argument('-e', '--end', default='2022-12-21', help='end date (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of processes (default: one per CPU)')
+    parser.add_argument('-c', '--cache-dir', default=None, help='cache downloaded data in this folder')
+    parser.add_argument('-o', '--output', default=None, help='save the results to this csv file')
+    args = parser.parse_args(argv)
+
+    tickers = list(args.tickers)
+    if (args.file):
+        tickers += read_tickers(args.file)
+    if (not tickers):
+        parser.error('no tickers given')
+
+    results = run_batch(tickers, args.start, args.end, workers=args.workers, cache_dir=args.cache_dir)
+
+    if (args.output):
+        results.to_csv(args.output)
+
+    with pd.option_context('display.max_rows', None, 'display.width', None):
+        print(results)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
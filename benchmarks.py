@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import stoks
+from synthetic import synthetic_stock_data
+
+
+# The numbers of candles each function is timed on by default.
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# The row by row functions take minutes on big data, so they're only timed up to this many candles.
+SLOW_LIMIT = 10_000
+
+
+# The most time `import stoks` can take in a new python, in seconds, and the modules
+# it must not import (they're only loaded when data is downloaded or turned into
+# dataframes). Most of the budget is numpy's own import.
+IMPORT_BUDGET = 0.3
+LAZY_MODULES = ('pandas', 'yfinance')
+
+
+# Every function that's timed, as (name, setup, slow).
+# setup takes the data and its ema and returns the function to time with no arguments.
+# slow is True for the functions that go through the data row by row.
+CASES = [
+    ('ema', lambda df, ema: lambda: stoks.ema(df), False),
+    ('ema_array[9,12,26,50]', lambda df, ema: lambda: stoks.ema_array(df['Close'], [9, 12, 26, 50]), False),
+    ('extend_ema (last 1%)', lambda df, ema: _extend_case(df, ema), False),
+    ('classify_candles', lambda df, ema: lambda: stoks.classify_candles(*stoks.ohlc_arrays(df)), False),
+    ('find_all_candle_types', lambda df, ema: lambda: stoks.find_all_candle_types(df), False),
+    ('scan', lambda df, ema: lambda: stoks.scan(df, ema), False),
+] + [
+    (f'VecStrats.{name}', lambda df, ema, name=name: lambda: getattr(stoks.VecStrats, name)(df, ema), False)
+    for name in stoks.PATTERNS
+] + [
+    (f'Strats.{name}', lambda df, ema, name=name: lambda: getattr(stoks.Strats, name)(df, ema), True)
+    for name in stoks.PATTERNS
+]
+
+
+# Times extending an ema with the last 1% of the candles.
+def _extend_case(df, ema):
+    split = len(ema) - max(len(ema) // 100, 1)
+    close = df['Close'].to_numpy()
+    return lambda: stoks.extend_ema(ema[:split], close[split:])
+
+
+# Runs func repeat times and returns the fastest time in seconds.
+def time_func(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# The most memory (in bytes) allocated at once while func runs.
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Times every case on synthetic data of every size.
+# Returns a list of results, one per case and size, each with the time, candles
+# per second, and peak memory.
+def run(sizes=SIZES, slow_limit=SLOW_LIMIT, repeat=3, only=None, seed=0):
+    results = []
+    for size in sizes:
+        df = synthetic_stock_data(size, seed=seed, freq='min')
+        ema = stoks.ema(df)
+
+        for name, setup, slow in CASES:
+            if (only and not any(part in name for part in only)):
+                continue
+            if (slow and size > slow_limit):
+                continue
+
+            func = setup(df, ema)
+            # A strat that never occurs raises a ZeroDivisionError, which still counts as a run.
+            func = _ignore_zero_division(func)
+            seconds = time_func(func, repeat)
+            results.append({
+                'name': name,
+                'bars': size,
+                'seconds': seconds,
+                'bars_per_sec': size / seconds if seconds > 0 else float('inf'),
+                'peak_bytes': peak_memory(func),
+            })
+            print(f'{name:<36} {size:>9,} bars  {seconds*1000:>10.2f} ms  '
+                  f'{results[-1]["bars_per_sec"]:>14,.0f} bars/s  {results[-1]["peak_bytes"]/1024**2:>8.2f} MiB')
+    return results
+
+
+def _ignore_zero_division(func):
+    def wrapped():
+        try:
+            func()
+        except ZeroDivisionError:
+            pass
+    return wrapped
+
+
+# How long importing a module takes in a new python, in seconds (the fastest of
+# repeat runs), and which of LAZY_MODULES it imported.
+def import_time(module='stoks', repeat=5):
+    code = ('import sys, time\n'
+            't = time.perf_counter()\n'
+            f'import {module}\n'
+            'print(time.perf_counter() - t)\n'
+            f'print(*[m for m in {LAZY_MODULES!r} if m in sys.modules])')
+    best = float('inf')
+    for _ in range(repeat):
+        # Runs from this folder so the module is found wherever this is run from.
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        seconds, loaded = out.split('\n')[:2]
+        best = min(best, float(seconds))
+    return best, loaded.split()
+
+
+# Checks that importing a module is within the budget and doesn't import any of
+# LAZY_MODULES. Returns a list of the problems found (empty if there are none).
+def check_import(module='stoks', budget=IMPORT_BUDGET, repeat=5):
+    seconds, loaded = import_time(module, repeat)
+    problems = [f'import {module} imported {name}' for name in loaded]
+    if (seconds > budget):
+        problems.append(f'import {module} took {seconds*1000:.0f} ms, over the {budget*1000:.0f} ms budget')
+    return problems
+
+
+# Information about where the benchmarks were run, saved with the results.
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+    }
+
+
+# Saves the results of run() to a json file.
+def save(results, path):
+    with open(path, 'w') as file:
+        json.dump({'environment': environment(), 'results': results}, file, indent=2)
+
+
+# Loads results saved by save().
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+# Compares two saved results and returns the cases that got slower by more than
+# threshold (0.1 = 10%), as (name, bars, old seconds, new seconds) tuples.
+def compare(old, new, threshold=0.1):
+    old_times = {(r['name'], r['bars']): r['seconds'] for r in old['results']}
+    slower = []
+    for r in new['results']:
+        key = (r['name'], r['bars'])
+        if (key in old_times and r['seconds'] > old_times[key] * (1 + threshold)):
+            slower.append((r['name'], r['bars'], old_times[key], r['seconds']))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Times the functions in stoks on synthetic data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='numbers of candles to time')
+    parser.add_argument('--slow-limit', type=int, default=SLOW_LIMIT,
+                        help='largest size the row by row functions are timed on (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the fastest is kept')
+    parser.add_argument('--only', nargs='+', help='only time cases with one of these in their name')
+    parser.add_argument('-o', '--output', default='bench_results.json', help='json file to save results to')
+    parser.add_argument('--compare', help='a previous json file to check for slowdowns against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='how much slower counts as a slowdown (default: %(default)s)')
+    parser.add_argument('--import-check', action='store_true',
+                        help='only check how long importing stoks takes, and fail if it is over the budget')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET,
+                        help='seconds importing stoks can take (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if (args.import_check):
+        problems = check_import('stoks', args.import_budget)
+        for problem in problems:
+            print(f'IMPORT: {problem}')
+        if (problems):
+            raise SystemExit(1)
+        return
+
+    results = run(args.sizes, args.slow_limit, args.repeat, args.only)
+    save(results, args.output)
+
+    if (args.compare):
+        slower = compare(load(args.compare), load(args.output), args.threshold)
+        for name, bars, old, new in slower:
+            print(f'SLOWER: {name} at {bars:,} bars went from {old*1000:.2f} ms to {new*1000:.2f} ms')
+        if (slower):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
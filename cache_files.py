@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+
+
+# Helpers for the caches that keep .npz files in a folder (stock_cache.StockCache
+# and scan_cache.ScanCache), and delete the least recently used ones when the
+# folder gets too big, and for keeping track of which date ranges have been
+# fetched (StockCache and price_store.PriceStore).
+# Date ranges are [start, end) pairs of datetime64[D] days.
+
+
+# Every .npz file in a folder.
+def npz_files(directory):
+    return [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.npz')]
+
+
+# Saves arrays to a .npz file. It's written to a temporary file first so a crash
+# can't leave a broken file.
+def save_npz(path, **arrays):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(tmp_path, path)
+
+
+# Marks a file as recently used, so it's deleted last. Another process using the
+# same folder might have just deleted it, which is fine.
+def mark_used(path):
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+# Deletes the least recently used .npz files in a folder until they fit in
+# max_bytes, never deleting keep (the file that was just saved).
+# Several processes (like batch.run_batch()'s workers) can evict from the same
+# folder at once, so files that disappear while this runs are skipped.
+def evict(directory, max_bytes, keep=None):
+    files = []
+    for path in npz_files(directory):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+    total = sum(size for mtime, size, path in files)
+
+    for mtime, size, path in files:
+        if (total <= max_bytes):
+            break
+        if (path == keep):
+            continue
+        total -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# The parts of [start, end) that aren't covered by any of the fetched ranges.
+def missing_ranges(covered, start, end):
+    missing = []
+    for cov_start, cov_end in sorted(covered.tolist()):
+        cov_start = np.datetime64(cov_start, 'D')
+        cov_end = np.datetime64(cov_end, 'D')
+        if (cov_end <= start or cov_start >= end):
+            continue
+        if (cov_start > start):
+            missing.append((start, cov_start))
+        start = max(start, cov_end)
+        if (start >= end):
+            break
+    if (start < end):
+        missing.append((start, end))
+    return missing
+
+
+# Adds [start, end) to the fetched ranges, joining any ranges that touch or overlap.
+def merge_ranges(covered, start, end):
+    ranges = sorted([(np.datetime64(a, 'D'), np.datetime64(b, 'D')) for a, b in covered.tolist()]
+                    + [(start, end)])
+    merged = [list(ranges[0])]
+    for range_start, range_end in ranges[1:]:
+        if (range_start <= merged[-1][1]):
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return np.array(merged, dtype='datetime64[D]')
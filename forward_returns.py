@@ -0,0 +1,122 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import stoks
+
+
+# How many candles after a strat its returns are measured at by default.
+HORIZONS = (1, 2, 5, 10, 20)
+
+# The quantiles summarize() reports by default.
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+# Joins the close, high, low, and ema of every ticker in an EventTable into long
+# arrays, one ticker after another, and returns them with the offset and length
+# of each ticker. prices maps tickers to dataframes like get_stock_data()'s or dicts
+# of arrays, or is a PriceStore. Tickers without prices get a length of 0.
+def _joined_prices(prices, tickers, pds_to_incl):
+    get = prices.arrays if hasattr(prices, 'arrays') else prices.__getitem__
+    parts = {'Close': [], 'High': [], 'Low': [], 'EMA': []}
+    lengths = np.zeros(len(tickers), dtype=np.int64)
+
+    for t, ticker in enumerate(tickers):
+        if (ticker not in prices):
+            continue
+        candles = get(ticker)
+        close = np.asarray(candles['Close'], dtype=float)
+        parts['Close'].append(close)
+        parts['High'].append(np.asarray(candles['High'], dtype=float))
+        parts['Low'].append(np.asarray(candles['Low'], dtype=float))
+        parts['EMA'].append(stoks.ema_array(close, pds_to_incl))
+        lengths[t] = len(close)
+
+    joined = {col: np.concatenate(arrays) if arrays else np.empty(0) for col, arrays in parts.items()}
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return joined, offsets, lengths
+
+
+# Works out what happened after every event in an EventTable:
+#   Return N     - the percent change of the close N candles after the strat's last candle
+#   EMA Delta N  - the percent change of the ema over the same N candles
+#   MFE / MAE    - the max favorable and max adverse excursion: the best and worst
+#                  move (from the last candle's close to a later high or low) within
+#                  the longest horizon, signed so favorable is positive for both bullish
+#                  and bearish strats
+# Anything past the end of a ticker's data is nan.
+# Every ticker's prices are joined into long arrays first, so each of these is
+# one gather over every event in the table at once.
+def forward_outcomes(events, prices, horizons=HORIZONS, pds_to_incl=9):
+    horizons = list(horizons)
+    joined, offsets, lengths = _joined_prices(prices, events.tickers, pds_to_incl)
+
+    # The row of each strat's last candle, within its ticker and in the joined arrays.
+    num_candles = np.array([stoks.PATTERNS[name].num_candles if name in stoks.PATTERNS else 1
+                            for name in events.pattern_names], dtype=np.int64)
+    last = events.index + num_candles[events.pattern] - 1 if len(events) else events.index
+    start = offsets[events.ticker] + last
+    end = offsets[events.ticker] + lengths[events.ticker]
+
+    # A candle later than the last candle, as a joined row, or -1 if it's past the end of the data.
+    def later(steps):
+        rows = start[:, None] + steps
+        return np.where(rows < end[:, None], rows, -1)
+
+    # Gathers values at rows from later(), with nan for -1.
+    def gather(values, rows):
+        if (len(values) == 0):
+            return np.full(rows.shape, np.nan)
+        return np.where(rows >= 0, values[np.maximum(rows, 0)], np.nan)
+
+    valid = last < lengths[events.ticker]
+    base_close = gather(joined['Close'], np.where(valid, start, -1))
+    base_ema = gather(joined['EMA'], np.where(valid, start, -1))
+
+    frame = events.to_frame()
+    rows = later(np.array(horizons))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = gather(joined['Close'], rows) / base_close[:, None] - 1
+        ema_deltas = gather(joined['EMA'], rows) / base_ema[:, None] - 1
+    for k, horizon in enumerate(horizons):
+        frame[f'Return {horizon}'] = returns[:, k]
+    for k, horizon in enumerate(horizons):
+        frame[f'EMA Delta {horizon}'] = ema_deltas[:, k]
+
+    # The highs and lows of every candle up to the longest horizon.
+    path = later(np.arange(1, max(horizons) + 1))
+    with np.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+        # Events with no candles after them give all nan rows, which is fine.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        up = np.nanmax(gather(joined['High'], path), axis=1) / base_close - 1
+        down = np.nanmin(gather(joined['Low'], path), axis=1) / base_close - 1
+    bull = events.direction > 0
+    frame['MFE'] = np.where(bull, up, -down)
+    frame['MAE'] = np.where(bull, down, -up)
+    return frame
+
+
+# Sums up the outcomes from forward_outcomes() for each strat: the count, mean,
+# and quantiles of every measure, and the hit rate (the share of events that
+# moved the way the strat expects) of the return and ema delta at every horizon.
+# Events without data that far ahead are left out.
+def summarize(outcomes, quantiles=QUANTILES):
+    moves = [col for col in outcomes.columns if col.startswith(('Return ', 'EMA Delta '))]
+    measures = moves + ['MFE', 'MAE']
+
+    # Whether each move went the way the strat expects (nan if there's no data).
+    direction = np.where(outcomes['Direction'] == 'bull', 1, -1)
+    hits = (outcomes[moves].mul(direction, axis=0) > 0).where(outcomes[moves].notna())
+    hits['Strat'] = outcomes['Strat']
+
+    grouped = outcomes.groupby('Strat', observed=True)[measures]
+    stats = {'count': grouped.count(), 'mean': grouped.mean()}
+    for q in quantiles:
+        stats[f'q{q:g}'] = grouped.quantile(q)
+    stats['hit rate'] = hits.groupby('Strat', observed=True)[moves].mean().reindex(columns=measures)
+
+    summary = pd.concat(stats, axis=1)
+    # Puts each measure's statistics next to each other.
+    summary.columns = summary.columns.swaplevel(0, 1)
+    return summary[[(measure, stat) for measure in measures for stat in stats]]
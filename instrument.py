@@ -0,0 +1,198 @@
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Instrumentation is off until enable() is called. While it's off, an instrumented
+# function only checks this before running as normal.
+_enabled = False
+_track_memory = False
+
+# What's been recorded for each stage, by name.
+_stages = {}
+
+
+# Turns instrumentation on. If memory is True, the bytes allocated in each stage
+# are tracked too (using tracemalloc, which slows everything down).
+def enable(memory=False):
+    global _enabled, _track_memory
+    _enabled = True
+    _track_memory = memory
+    if (memory and not tracemalloc.is_tracing()):
+        tracemalloc.start()
+
+
+# Turns instrumentation off. What's been recorded so far is kept until reset().
+def disable():
+    global _enabled, _track_memory
+    if (_track_memory and tracemalloc.is_tracing()):
+        tracemalloc.stop()
+    _enabled = False
+    _track_memory = False
+
+
+def is_enabled():
+    return _enabled
+
+
+# Throws away everything that's been recorded.
+def reset():
+    _stages.clear()
+
+
+# Does nothing, for when instrumentation is off.
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+# The stages that are running right now, innermost last (only kept while memory is tracked).
+_open_stages = []
+
+
+# Records the time, call count, candles, and memory of one run of a stage.
+# tracemalloc only has one peak for the whole program, so each stage resets it when
+# it starts. A stage that has stages inside it keeps the highest peak they saw, since
+# they reset it too.
+class _Stage:
+    def __init__(self, name, bars=0):
+        self.name = name
+        self.bars = bars
+
+    def __enter__(self):
+        if (_track_memory and tracemalloc.is_tracing()):
+            current, peak = tracemalloc.get_traced_memory()
+            if (_open_stages):
+                _open_stages[-1].peak = max(_open_stages[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.mem_start = current
+            self.peak = current
+            _open_stages.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+
+        alloc = 0
+        if (self in _open_stages):
+            _open_stages.remove(self)
+            if (tracemalloc.is_tracing()):
+                self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            # The most memory used at once inside the stage, over what was in use when it started.
+            alloc = max(self.peak - self.mem_start, 0)
+            if (_open_stages):
+                _open_stages[-1].peak = max(_open_stages[-1].peak, self.peak)
+
+        stats = _stages.setdefault(self.name, {'calls': 0, 'seconds': 0.0, 'bars': 0, 'alloc_bytes': 0})
+        stats['calls'] += 1
+        stats['seconds'] += seconds
+        stats['bars'] += self.bars
+        stats['alloc_bytes'] += alloc
+        return False
+
+
+# A context manager that records the code inside it as a stage.
+# bars is the number of candles it works on, if known (it can also be set on the
+# stage inside the with block, like stage.bars = len(df.index)).
+def stage(name, bars=0):
+    if (not _enabled):
+        return _NULL_STAGE
+    return _Stage(name, bars)
+
+
+# A decorator that records every call of a function as a stage.
+# bars is a function called as bars(result, *args, **kwargs) that returns the
+# number of candles the call worked on, like result_len or first_arg_len.
+def instrumented(name=None, bars=None):
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if (not _enabled):
+                return func(*args, **kwargs)
+            with _Stage(stage_name) as run:
+                result = func(*args, **kwargs)
+                if (bars is not None):
+                    run.bars = bars(result, *args, **kwargs)
+            return result
+        return wrapper
+    return decorator
+
+
+# The number of candles for functions that return one value per candle.
+def result_len(result, *args, **kwargs):
+    return len(result)
+
+
+# The number of candles for functions that take the candles first.
+def first_arg_len(result, data, *args, **kwargs):
+    return len(data)
+
+
+# Everything that's been recorded, as a dict that can be saved as json.
+def report():
+    stages = {}
+    for name, stats in _stages.items():
+        stages[name] = dict(stats)
+        stages[name]['mean_seconds'] = stats['seconds'] / stats['calls']
+        stages[name]['bars_per_sec'] = stats['bars'] / stats['seconds'] if stats['seconds'] > 0 else None
+    return {'memory_tracked': _track_memory, 'stages': stages}
+
+
+# Saves report() to a json file.
+def save_report(path):
+    with open(path, 'w') as file:
+        json.dump(report(), file, indent=2)
+
+
+# Prints report() as a table, slowest stage first.
+def print_report():
+    stages = report()['stages']
+    print(f'{"stage":<40} {"calls":>7} {"total ms":>11} {"bars":>11} {"MiB":>9}')
+    for name, stats in sorted(stages.items(), key=lambda item: -item[1]['seconds']):
+        print(f'{name:<40} {stats["calls"]:>7} {stats["seconds"]*1000:>11.2f} '
+              f'{stats["bars"]:>11,} {stats["alloc_bytes"]/1024**2:>9.2f}')
+
+
+# Records everything that runs inside it, then saves:
+#   prefix.json        - the report of every instrumented stage
+#   prefix.prof        - cProfile stats (if cprofile is True), for pstats or snakeviz
+#   prefix_memory.txt  - the lines that allocated the most memory (if memory is True)
+@contextmanager
+def capture(prefix='profile', cprofile=True, memory=True):
+    # cProfile is only imported when it's used, since importing instrument has to be fast.
+    import cProfile
+
+    reset()
+    enable(memory)
+    profiler = cProfile.Profile() if cprofile else None
+    if (profiler):
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if (profiler):
+            profiler.disable()
+            profiler.dump_stats(prefix + '.prof')
+        if (memory and tracemalloc.is_tracing()):
+            top = tracemalloc.take_snapshot().statistics('lineno')[:25]
+            with open(prefix + '_memory.txt', 'w') as file:
+                file.writelines(f'{stat}\n' for stat in top)
+        save_report(prefix + '.json')
+        disable()
+
+
+# Prints the functions that took the most time in a saved cProfile file.
+def print_profile(path, limit=20):
+    import pstats
+    pstats.Stats(path).sort_stats('cumulative').print_stats(limit)
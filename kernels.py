@@ -0,0 +1,196 @@
+import types
+
+import numpy as np
+
+import stoks
+
+# Numba is optional. Without it, the same kernels run as plain Python (slowly) or
+# the numpy versions in stoks are used instead.
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HAS_NUMBA = numba is not None
+
+# The backends the kernels can run on:
+#   'numba'  - the kernels below compiled to machine code (needs numba)
+#   'numpy'  - the vectorized versions in stoks
+#   'python' - the kernels below run as plain Python, for checking the others
+BACKENDS = ('numba', 'numpy', 'python')
+
+# The built in strats the combined kernel finds, in the order of its output rows.
+KERNEL_PATTERNS = ('bullish_engulfing', 'bearish_engulfing', 'piercing',
+                   'dark_cloud_cover', 'hammer', 'shooting_star')
+
+
+# The backend used when none is given: numba if it's installed, otherwise numpy.
+def default_backend():
+    return 'numba' if HAS_NUMBA else 'numpy'
+
+
+# The ema recurrence, one candle at a time. It does the exact same math as
+# stoks.extend_ema(), so every backend gives the same numbers down to the last bit.
+def _ema_kernel(close, smooth):
+    out = np.empty(len(close))
+    if (len(close) == 0):
+        return out
+    prev = close[0]
+    out[0] = prev
+    for i in range(1, len(close)):
+        prev = (close[i] * smooth) + (prev * (1 - smooth))
+        out[i] = prev
+    return out
+
+
+# Whether a bullish and a bearish strat ending on each candle is successful,
+# like stoks.succ_masks().
+def _succ_kernel(ema, horizon):
+    n = len(ema)
+    bull = np.zeros(n, dtype=np.bool_)
+    bear = np.zeros(n, dtype=np.bool_)
+    for i in range(n - horizon):
+        bull[i] = ema[i + horizon] > ema[i]
+        bear[i] = ema[i + horizon] < ema[i]
+    return bull, bear
+
+
+# The candle type code of one candle, like stoks.classify_types().
+def _candle_type(o, h, l, c, doji_limit):
+    total = h - l
+    if (total == 0):
+        return 0
+    if (abs(o - c) / total <= doji_limit):
+        return 1
+    if (c > o):
+        return 2
+    if (c < o):
+        return 3
+    return 0
+
+
+# The candle name code of one candle, like stoks.classify_names().
+def _candle_name(o, h, l, c):
+    body = abs(c - o)
+    total = h - l
+    upper = h - max(c, o)
+    lower = min(c, o) - l
+    if (total != 0 and lower > body * 2 and upper / total < 0.1):
+        return 1
+    if (total != 0 and upper > body * 2 and lower / total < 0.1):
+        return 2
+    return 0
+
+
+# Finds every strat in KERNEL_PATTERNS and its outcome in one loop over the candles.
+# Returns two boolean arrays with a row per strat: where each strat is dated, and
+# which of those are successful, the same as stoks.scan() finds.
+def _patterns_kernel(o, h, l, c, ema, doji_limit, horizon):
+    n = len(c)
+    hits = np.zeros((6, n), dtype=np.bool_)
+    succ = np.zeros((6, n), dtype=np.bool_)
+
+    for i in range(n):
+        # Just like downtrend() and uptrend(), the first candle is compared to the last one.
+        prev = ema[i - 1] if i > 0 else ema[n - 1]
+        down = ema[i] < prev
+        up = ema[i] > prev
+        kind = _candle_type(o[i], h[i], l[i], c[i], doji_limit)
+
+        # Two candle strats, which need the next candle and horizon more after it.
+        if (i < n - horizon - 1):
+            last = i + 1
+            rises = ema[last + horizon] > ema[last]
+            falls = ema[last + horizon] < ema[last]
+            if (down and kind == 3):
+                if (o[i + 1] < c[i] and c[i + 1] > o[i]):
+                    hits[0, i] = True
+                    succ[0, i] = rises
+                if (o[i + 1] < c[i] and c[i + 1] > c[i] + ((o[i] - c[i]) / 2)):
+                    hits[2, i] = True
+                    succ[2, i] = rises
+            if (up and kind == 2):
+                if (o[i + 1] > c[i] and c[i + 1] < o[i]):
+                    hits[1, i] = True
+                    succ[1, i] = falls
+                if (o[i + 1] > c[i] and c[i + 1] < o[i] + ((c[i] - o[i]) / 2)):
+                    hits[3, i] = True
+                    succ[3, i] = falls
+
+        # One candle strats, which need horizon candles after them.
+        if (i < n - horizon and down):
+            name = _candle_name(o[i], h[i], l[i], c[i])
+            if (name == 1):
+                hits[4, i] = True
+                succ[4, i] = ema[i + horizon] > ema[i]
+            elif (name == 2):
+                hits[5, i] = True
+                succ[5, i] = ema[i + horizon] < ema[i]
+
+    return hits, succ
+
+
+# The numba compiled kernels, made the first time they're needed since compiling takes a moment.
+_compiled = {}
+
+
+def _kernel(name, backend):
+    kernels = {'ema': _ema_kernel, 'succ': _succ_kernel, 'patterns': _patterns_kernel}
+    if (backend == 'python'):
+        return kernels[name]
+    if (not HAS_NUMBA):
+        raise ImportError("the 'numba' backend needs numba to be installed")
+
+    if (not _compiled):
+        # The compiled kernels get their own copy of this module's globals with the
+        # helpers swapped for compiled ones, so the plain Python helpers (which the
+        # 'python' backend uses) are left as they are.
+        namespace = dict(globals())
+        for helper in ('_candle_type', '_candle_name'):
+            namespace[helper] = _compiled[helper] = numba.njit(cache=True)(globals()[helper])
+        for key, func in kernels.items():
+            copy = types.FunctionType(func.__code__, namespace, func.__name__, func.__defaults__)
+            _compiled[key] = numba.njit(cache=True)(copy)
+    return _compiled[name]
+
+
+def _check_backend(backend):
+    backend = default_backend() if backend is None else backend
+    if (backend not in BACKENDS):
+        raise ValueError(f'backend must be one of {BACKENDS}, not {backend!r}')
+    return backend
+
+
+# The ema of an array of closing prices, like stoks.ema_array() with one number of periods.
+def ema(close, pds_to_incl=9, backend=None):
+    backend = _check_backend(backend)
+    close = np.ascontiguousarray(close, dtype=float)
+    if (backend == 'numpy'):
+        return stoks.ema_array(close, pds_to_incl)
+    return _kernel('ema', backend)(close, 2 / (pds_to_incl + 1))
+
+
+# Whether a bullish and a bearish strat ending on each candle is successful, like
+# stoks.succ_masks().
+def succ_masks(ema, horizon=2, backend=None):
+    backend = _check_backend(backend)
+    ema = np.ascontiguousarray(ema, dtype=float)
+    if (backend == 'numpy'):
+        return stoks.succ_masks(ema, horizon)
+    return _kernel('succ', backend)(ema, horizon)
+
+
+# Finds every strat in KERNEL_PATTERNS and whether it's successful, from raw
+# arrays. Returns a dict of strat name to (hits, succ) arrays, the same as the
+# masks stoks.scan() finds.
+# Strats added with stoks.register_pattern() only run on the numpy backend.
+def scan_patterns(o, h, l, c, ema, doji_limit=stoks.DOJI_LIMIT, horizon=2, backend=None):
+    backend = _check_backend(backend)
+    o, h, l, c, ema = (np.ascontiguousarray(x, dtype=float) for x in (o, h, l, c, ema))
+
+    if (backend == 'numpy'):
+        arr = stoks.ScanArrays(o, h, l, c, ema, *stoks.classify_candles(o, h, l, c, doji_limit), horizon)
+        return {name: stoks.PATTERNS[name].masks(arr) for name in KERNEL_PATTERNS}
+
+    hits, succ = _kernel('patterns', backend)(o, h, l, c, ema, doji_limit, horizon)
+    return {name: (hits[k], succ[k]) for k, name in enumerate(KERNEL_PATTERNS)}
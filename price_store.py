@@ -0,0 +1,274 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import stoks
+from cache_files import merge_ranges
+
+
+# The columns in the store and the type each one is stored as (None means price_dtype).
+# Dates are stored as int64 nanoseconds since 1970-01-01. Prices default to float64
+# but can be float32 to halve their size.
+STORE_COLUMNS = {
+    'Date': np.int64,
+    'Open': None,
+    'High': None,
+    'Low': None,
+    'Close': None,
+    'Adj Close': None,
+    'Volume': np.int64,
+}
+
+
+# Stock data on many tickers packed into one memory mapped file per column, so a
+# whole universe of tickers can be scanned without fitting in memory.
+# Each ticker's candles are stored one after another, and index has the
+# [offset, length] of each ticker's candles in every column. Reading a ticker
+# gives views into the files without copying anything, and the operating system
+# only loads the parts that are used.
+# covered has the date ranges that have been fetched for each ticker (see cover()),
+# so days without candles (weekends, holidays, before a ticker was listed) aren't
+# fetched again.
+#
+# mode is 'r' to only read, or 'a' to also add tickers (creating the store if needed).
+class PriceStore:
+    def __init__(self, path, mode='r', price_dtype=np.float64):
+        self.path = path
+        self.mode = mode
+        self._maps = {}
+
+        if (os.path.exists(self._meta_path())):
+            with open(self._meta_path()) as file:
+                meta = json.load(file)
+            self.dtypes = {col: np.dtype(dtype) for col, dtype in meta['dtypes'].items()}
+            self.index = {ticker: tuple(span) for ticker, span in meta['index'].items()}
+            self.length = meta['length']
+            self._covered = meta.get('covered', {})
+        elif (mode == 'a'):
+            os.makedirs(path, exist_ok=True)
+            self.dtypes = {col: np.dtype(dtype or price_dtype) for col, dtype in STORE_COLUMNS.items()}
+            self.index = {}
+            self.length = 0
+            self._covered = {}
+            self._save_meta()
+        else:
+            raise FileNotFoundError(f'no price store at {path}')
+
+
+    def _meta_path(self):
+        return os.path.join(self.path, 'meta.json')
+
+
+    def _column_path(self, col):
+        return os.path.join(self.path, col.replace(' ', '_') + '.bin')
+
+
+    def _save_meta(self):
+        meta = {
+            'dtypes': {col: dtype.str for col, dtype in self.dtypes.items()},
+            'index': self.index,
+            'length': self.length,
+            'covered': self._covered,
+        }
+        tmp_path = self._meta_path() + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, self._meta_path())
+
+
+    def __contains__(self, ticker):
+        return ticker in self.index
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def tickers(self):
+        return list(self.index)
+
+
+    # The date ranges that have been fetched for a ticker, as [start, end) pairs of days.
+    # If none were recorded, it's the days from its first candle to its last one.
+    def covered(self, ticker):
+        if (ticker in self._covered):
+            return np.array(self._covered[ticker], dtype='datetime64[D]').reshape(-1, 2)
+        dates = self.arrays(ticker)['Date'] if ticker in self else []
+        if (len(dates) == 0):
+            return np.empty((0, 2), dtype='datetime64[D]')
+        days = dates[[0, -1]].astype('datetime64[D]')
+        return np.array([[days[0], days[1] + 1]], dtype='datetime64[D]')
+
+
+    # Records that the days from start up to (but not including) end have been fetched
+    # for a ticker, including any of them that had no candles.
+    def cover(self, ticker, start, end):
+        self._check_writable()
+        covered = merge_ranges(self.covered(ticker), np.datetime64(start, 'D'), np.datetime64(end, 'D'))
+        self._covered[ticker] = [[str(a), str(b)] for a, b in covered]
+        self._save_meta()
+
+
+    def _check_writable(self):
+        if (self.mode != 'a'):
+            raise PermissionError('the price store was opened read only')
+
+
+    # Writes df's columns to the end of the files and returns how many candles it added.
+    def _append(self, ticker, df):
+        missing = [col for col in self.dtypes if col not in df.columns]
+        if (missing):
+            raise KeyError(f'the data on {ticker} has no {", ".join(missing)} column')
+
+        dates = df['Date'].to_numpy()
+        if (dates.dtype.kind == 'M'):
+            dates = dates.astype('datetime64[ns]').view(np.int64)
+
+        try:
+            for col, dtype in self.dtypes.items():
+                values = dates if col == 'Date' else df[col].to_numpy()
+                with open(self._column_path(col), 'ab') as file:
+                    np.ascontiguousarray(values, dtype=dtype).tofile(file)
+        except BaseException:
+            # Cuts every file back to where it was, so the columns can't get out of
+            # line with each other and the next ticker isn't given this one's candles.
+            for col, dtype in self.dtypes.items():
+                if (os.path.exists(self._column_path(col))):
+                    os.truncate(self._column_path(col), self.length * dtype.itemsize)
+            raise
+
+        self.length += len(df.index)
+        # The files grew, so they need to be mapped again.
+        self._maps = {}
+        return len(df.index)
+
+
+    # Adds a ticker's data (a dataframe like get_stock_data()'s) to the end of the files.
+    # Adding a ticker that's already stored points it at the new data (and forgets
+    # what was fetched for it); the old data stays in the files until compact().
+    def add(self, ticker, df):
+        self._check_writable()
+        offset = self.length
+        self.index[ticker] = (offset, self._append(ticker, df))
+        self._covered.pop(ticker, None)
+        self._save_meta()
+
+
+    # Adds new candles to a ticker's data. If they all come after its stored candles
+    # and its candles are the last ones in the files, only the new candles are
+    # written. Otherwise its candles are merged with the new ones (which replace any
+    # on the same dates) and written again, leaving the old ones until compact().
+    def extend(self, ticker, df):
+        self._check_writable()
+        if (ticker not in self):
+            self.add(ticker, df)
+            return
+        if (len(df.index) == 0):
+            return
+
+        offset, length = self.index[ticker]
+        stored_dates = self.arrays(ticker)['Date']
+        new_dates = np.asarray(df['Date'].to_numpy(), dtype='datetime64[ns]')
+        if (offset + length == self.length and (length == 0 or new_dates.min() > stored_dates[-1])):
+            df = df.iloc[np.argsort(new_dates, kind='stable')]
+            self.index[ticker] = (offset, length + self._append(ticker, df))
+            self._save_meta()
+            return
+
+        merged = pd.concat([self.frame(ticker), df], ignore_index=True)
+        merged['Date'] = merged['Date'].astype('datetime64[ns]')
+        merged = merged.drop_duplicates('Date', keep='last').sort_values('Date', kind='stable')
+        self.index[ticker] = (self.length, self._append(ticker, merged))
+        self._save_meta()
+
+
+    # Rewrites the files with only the candles tickers point at, dropping the old
+    # data left behind by add() and extend().
+    def compact(self):
+        self._check_writable()
+        index = {}
+        offset = 0
+        for col, dtype in self.dtypes.items():
+            column = self._column(col)
+            tmp_path = self._column_path(col) + '.tmp'
+            with open(tmp_path, 'wb') as file:
+                offset = 0
+                for ticker, (start, length) in self.index.items():
+                    np.ascontiguousarray(column[start:start + length]).tofile(file)
+                    index[ticker] = (offset, length)
+                    offset += length
+
+        self._maps = {}
+        for col in self.dtypes:
+            os.replace(self._column_path(col) + '.tmp', self._column_path(col))
+        self.index = index
+        self.length = offset
+        self._save_meta()
+
+
+    # The memory map of a whole column.
+    def _column(self, col):
+        if (col not in self._maps):
+            if (self.length == 0):
+                self._maps[col] = np.empty(0, dtype=self.dtypes[col])
+            else:
+                self._maps[col] = np.memmap(self._column_path(col), dtype=self.dtypes[col],
+                                            mode='r', shape=(self.length,))
+        return self._maps[col]
+
+
+    # Views of a ticker's columns, without copying anything.
+    # Date is a datetime64[ns] view of the stored nanoseconds.
+    def arrays(self, ticker):
+        offset, length = self.index[ticker]
+        arrays = {col: self._column(col)[offset:offset + length].view(np.ndarray) for col in self.dtypes}
+        arrays['Date'] = arrays['Date'].view('datetime64[ns]')
+        return arrays
+
+
+    # A ticker's data as a dataframe like get_stock_data()'s, optionally only from
+    # the start date up to (but not including) the end date.
+    def frame(self, ticker, start_date=None, end_date=None):
+        arrays = self.arrays(ticker)
+        dates = arrays['Date']
+        first = 0 if start_date is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date)))
+        last = len(dates) if end_date is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date)))
+        return pd.DataFrame({col: values[first:last] for col, values in arrays.items()}, copy=False)
+
+
+    # Yields the tickers in groups of at most max_bars candles (a ticker with more
+    # than that is its own group), as lists of (ticker, arrays) pairs.
+    def chunks(self, max_bars=1_000_000, tickers=None):
+        chunk = []
+        bars = 0
+        for ticker in (self.tickers() if tickers is None else tickers):
+            length = self.index[ticker][1]
+            if (chunk and bars + length > max_bars):
+                yield chunk
+                chunk = []
+                bars = 0
+            chunk.append((ticker, self.arrays(ticker)))
+            bars += length
+        if (chunk):
+            yield chunk
+
+
+# Runs every strat (or just the names in patterns) on every ticker in a store,
+# a chunk at a time, straight from the memory mapped arrays.
+# Only the events are kept, so the memory used depends on the chunk size and not
+# the size of the store. Returns one EventTable for every ticker.
+def scan_store(store, pds_to_incl=9, patterns=None, max_bars=1_000_000, tickers=None, horizon=2):
+    if (patterns is None):
+        patterns = list(stoks.PATTERNS)
+
+    tables = []
+    for chunk in store.chunks(max_bars, tickers):
+        for ticker, arrays in chunk:
+            o, h, l, c = (arrays[col] for col in ('Open', 'High', 'Low', 'Close'))
+            ema = stoks.ema_array(c, pds_to_incl)
+            arr = stoks.ScanArrays(o, h, l, c, ema, *stoks.classify_candles(o, h, l, c), horizon)
+            masks = {name: stoks.PATTERNS[name].masks(arr) for name in patterns}
+            tables.append(stoks.EventTable.from_masks(arrays['Date'], masks, ticker))
+    return stoks.EventTable.concat(tables)
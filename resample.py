@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+
+# Timeframes are 'W' for weekly candles (weeks start on Monday), 'M' for monthly
+# candles, or a number N for candles made of every N candles.
+
+
+# The rows where each new candle of the timeframe starts, for candles from row
+# first_row on (which must be the start of a candle).
+def _group_starts(dates, timeframe, first_row=0):
+    n = len(dates)
+    if (isinstance(timeframe, (int, np.integer))):
+        return np.arange(first_row, n, timeframe)
+
+    days = np.asarray(dates[first_row:]).astype('datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    if (timeframe == 'W'):
+        # 1970-01-01 was a Thursday, so this makes weeks start on Monday.
+        keys = (days + 3) // 7
+    elif (timeframe == 'M'):
+        keys = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    else:
+        raise ValueError(f"timeframe must be 'W', 'M', or a number of candles, not {timeframe!r}")
+
+    if (len(keys) == 0):
+        return np.empty(0, dtype=np.int64)
+    return first_row + np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+
+
+# Combines the candles of df into bigger candles, starting at each row in starts.
+# The open is the first open, the high the highest high, the low the lowest low,
+# the close (and adjusted close) the last close, the volume the total volume, and
+# the date the first candle's date.
+def _aggregate(df, starts):
+    n = len(df.index)
+    if (len(starts) == 0):
+        return df.iloc[:0].reset_index(drop=True)
+    ends = np.append(starts[1:], n) - 1
+
+    columns = {'Date': df['Date'].to_numpy()[starts]}
+    for col in df.columns:
+        if (col == 'Date'):
+            continue
+        values = df[col].to_numpy()
+        if (col == 'Open'):
+            columns[col] = values[starts]
+        elif (col == 'High'):
+            columns[col] = np.maximum.reduceat(values, starts)
+        elif (col == 'Low'):
+            columns[col] = np.minimum.reduceat(values, starts)
+        elif (col in ('Close', 'Adj Close')):
+            columns[col] = values[ends]
+        elif (col == 'Volume'):
+            columns[col] = np.add.reduceat(values, starts)
+    return pd.DataFrame(columns)
+
+
+# Turns candles (like get_stock_data()'s daily candles) into candles of a bigger
+# timeframe, all in one go. The result has the same columns, so ema(), scan(),
+# and the Strats work on it the same way.
+def resample(df, timeframe):
+    return _aggregate(df, _group_starts(df['Date'].to_numpy(), timeframe))
+
+
+# Keeps the base candles and every timeframe made from them, so each timeframe is
+# only built once. When new base candles are added with append(), only the last
+# candle of each timeframe (which might not be finished) and the new ones after it
+# are rebuilt.
+class TimeframeCache:
+    def __init__(self, df, timeframes=('W', 'M')):
+        self.base = df.reset_index(drop=True)
+        self._frames = {}
+        # The row in base that the last candle of each timeframe starts on.
+        self._last_start = {}
+        for timeframe in timeframes:
+            self._build(timeframe)
+
+
+    def _build(self, timeframe):
+        starts = _group_starts(self.base['Date'].to_numpy(), timeframe)
+        self._frames[timeframe] = _aggregate(self.base, starts)
+        self._last_start[timeframe] = int(starts[-1]) if len(starts) else 0
+
+
+    # The candles of a timeframe (1 gives the base candles), building them the first
+    # time they're asked for.
+    def get(self, timeframe):
+        if (timeframe == 1):
+            return self.base
+        if (timeframe not in self._frames):
+            self._build(timeframe)
+        return self._frames[timeframe]
+
+
+    def timeframes(self):
+        return list(self._frames)
+
+
+    # Adds new base candles (which must come after the ones already here) and
+    # updates every timeframe from the start of its last candle on.
+    def append(self, new_df):
+        self.base = pd.concat([self.base, new_df], ignore_index=True)
+        dates = self.base['Date'].to_numpy()
+
+        for timeframe, frame in self._frames.items():
+            first_row = self._last_start[timeframe]
+            starts = _group_starts(dates, timeframe, first_row)
+            tail = _aggregate(self.base.iloc[first_row:].reset_index(drop=True), starts - first_row)
+
+            # Replaces the last candle, which might have had more candles added to it.
+            kept = frame.iloc[:len(frame.index) - 1] if len(frame.index) else frame
+            self._frames[timeframe] = pd.concat([kept, tail], ignore_index=True)
+            self._last_start[timeframe] = int(starts[-1]) if len(starts) else first_row
@@ -0,0 +1,302 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+import stoks
+from cache_files import evict, mark_used, npz_files, save_npz
+
+
+# The columns a scan's fingerprint is made from. Adj Close isn't used by any strat.
+FINGERPRINT_COLUMNS = ('Date', 'Open', 'High', 'Low', 'Close', 'Volume')
+
+
+# Everything worked out for one scan: the ema, the candle type and name codes, and
+# the (hits, succ) arrays of every strat, as 2D arrays with a row per strat in the
+# order of patterns. result is the ScanResult stoks.scan() would give.
+class ScanEntry:
+    def __init__(self, fingerprint, settings, ema, types, names, hits, succ, patterns, dates, ticker='',
+                 horizon=2):
+        self.fingerprint = fingerprint
+        self.settings = settings
+        self.ticker = ticker
+        self.ema = ema
+        self.types = types
+        self.names = names
+        self.hits = hits
+        self.succ = succ
+        self.patterns = list(patterns)
+        masks = {name: (hits[k], succ[k]) for k, name in enumerate(self.patterns)}
+        self.result = stoks.ScanResult(dates, masks, ticker, horizon)
+
+
+    def __len__(self):
+        return len(self.ema)
+
+
+    @property
+    def events(self):
+        return self.result.events
+
+
+# Remembers the scans of data it's seen before, so running the same ticker, dates,
+# and settings again (in another notebook or batch job) doesn't redo the work.
+# Each scan is keyed by a fingerprint (a hash) of the data's columns and the
+# settings, so changed data or settings are never mistaken for the old ones.
+#
+# The last max_entries scans are kept in memory. If cache_dir is given they're
+# also saved there, one .npz file per scan, and the least recently used files are
+# deleted when they take up more than max_bytes.
+#
+# When the data is a scan that's already cached with new candles added to the end
+# (like the same ticker a day later), only the new candles are worked out: the ema
+# carries on from its last value, only the new candles are classified, and the
+# strats only run again on the last few candles, whose outcomes the new ones can change.
+class ScanCache:
+    def __init__(self, cache_dir=None, max_entries=32, max_bytes=256 * 1024**2):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        # How each scan was found: in memory, on disk, extended from a cached
+        # scan of fewer candles, or computed from scratch.
+        self.stats = {'memory': 0, 'disk': 0, 'extended': 0, 'computed': 0}
+        if (cache_dir is not None):
+            os.makedirs(cache_dir, exist_ok=True)
+
+
+    # The same as stoks.scan(df, stoks.ema(df, pds_to_incl), patterns, ticker, horizon),
+    # but only worked out if it isn't cached.
+    def scan(self, df, pds_to_incl=9, patterns=None, ticker='', horizon=2, doji_limit=stoks.DOJI_LIMIT):
+        return self.get(df, pds_to_incl, patterns, ticker, horizon, doji_limit).result
+
+
+    # The ScanEntry of df with the given settings, from the cache if it's there.
+    def get(self, df, pds_to_incl=9, patterns=None, ticker='', horizon=2, doji_limit=stoks.DOJI_LIMIT):
+        if (patterns is None):
+            patterns = list(stoks.PATTERNS)
+        patterns = list(patterns)
+        columns = _fingerprint_columns(df)
+        settings = _settings_key(pds_to_incl, patterns, horizon, doji_limit)
+        fingerprint = _fingerprint(ticker, settings, columns)
+        dates = df['Date'].to_numpy()
+
+        entry = self._memory.get(fingerprint)
+        if (entry is not None):
+            self._memory.move_to_end(fingerprint)
+            self.stats['memory'] += 1
+            return entry
+
+        saved = self._load(ticker, settings, len(dates), fingerprint)
+        if (saved is not None):
+            self.stats['disk'] += 1
+            entry = ScanEntry(fingerprint, settings, *saved, patterns, dates, ticker, horizon)
+            self._remember(entry)
+            return entry
+
+        o, h, l, c = stoks.ohlc_arrays(df)
+        prefix = self._find_prefix(ticker, settings, columns, len(dates))
+        if (prefix is not None and _cut(len(prefix[0]), patterns, horizon) >= 2):
+            self.stats['extended'] += 1
+            arrays = _extend(prefix, o, h, l, c, pds_to_incl, patterns, horizon, doji_limit)
+        else:
+            self.stats['computed'] += 1
+            arrays = _compute(o, h, l, c, pds_to_incl, patterns, horizon, doji_limit)
+
+        entry = ScanEntry(fingerprint, settings, *arrays, patterns, dates, ticker, horizon)
+        self._remember(entry)
+        self._save(ticker, settings, entry)
+        return entry
+
+
+    # Forgets every scan, and deletes the saved ones.
+    def clear(self):
+        self._memory.clear()
+        for path in self._files():
+            os.remove(path)
+
+
+    # The number of bytes the saved scans take up.
+    def size(self):
+        return sum(os.path.getsize(path) for path in self._files())
+
+
+    # Keeps an entry in memory, forgetting the least recently used one if there are too many.
+    def _remember(self, entry):
+        self._memory[entry.fingerprint] = entry
+        self._memory.move_to_end(entry.fingerprint)
+        while (len(self._memory) > self.max_entries):
+            self._memory.popitem(last=False)
+
+
+    # Finds the longest cached scan (in memory or on disk) of the same ticker and
+    # settings whose candles are the first candles of columns, and returns its
+    # (ema, types, names, hits, succ) arrays.
+    def _find_prefix(self, ticker, settings, columns, length):
+        candidates = {}
+        for entry in self._memory.values():
+            if (entry.ticker == ticker and entry.settings == settings and len(entry) < length):
+                candidates.setdefault((len(entry), entry.fingerprint), entry)
+        for prefix_length, fingerprint in self._saved(ticker, settings):
+            if (prefix_length < length):
+                candidates.setdefault((prefix_length, fingerprint), None)
+
+        for prefix_length, fingerprint in sorted(candidates, reverse=True):
+            head = {col: values[:prefix_length] for col, values in columns.items()}
+            if (_fingerprint(ticker, settings, head) != fingerprint):
+                continue
+            entry = candidates[(prefix_length, fingerprint)]
+            if (entry is not None):
+                return entry.ema, entry.types, entry.names, entry.hits, entry.succ
+            return self._load(ticker, settings, prefix_length, fingerprint)
+        return None
+
+
+    # The file a scan is saved in. The ticker, settings, and number of candles are
+    # in the name so scans that might be a prefix of new data can be found quickly.
+    def _path(self, ticker, settings, length, fingerprint):
+        return os.path.join(self.cache_dir, f'{_file_start(ticker, settings)}_{length}_{fingerprint}.npz')
+
+
+    # Every file in the cache.
+    def _files(self):
+        if (self.cache_dir is None):
+            return []
+        return npz_files(self.cache_dir)
+
+
+    # The (length, fingerprint) of every saved scan of a ticker with the given settings.
+    def _saved(self, ticker, settings):
+        if (self.cache_dir is None):
+            return []
+        start = _file_start(ticker, settings)
+        saved = []
+        for path in self._files():
+            name = os.path.basename(path)[:-len('.npz')]
+            if (name.startswith(start + '_')):
+                length, fingerprint = name[len(start) + 1:].split('_')
+                saved.append((int(length), fingerprint))
+        return saved
+
+
+    # Loads a saved scan's (ema, types, names, hits, succ) arrays, or returns None
+    # if it isn't saved.
+    def _load(self, ticker, settings, length, fingerprint):
+        if (self.cache_dir is None):
+            return None
+        path = self._path(ticker, settings, length, fingerprint)
+        if (not os.path.exists(path)):
+            return None
+
+        with np.load(path) as saved:
+            arrays = tuple(saved[key] for key in ('ema', 'types', 'names', 'hits', 'succ'))
+        mark_used(path)
+        return arrays
+
+
+    # Saves a scan, then deletes the least recently used ones if the cache is too big.
+    def _save(self, ticker, settings, entry):
+        if (self.cache_dir is None):
+            return
+        path = self._path(ticker, settings, len(entry), entry.fingerprint)
+        save_npz(path, ema=entry.ema, types=entry.types, names=entry.names,
+                 hits=entry.hits, succ=entry.succ)
+        evict(self.cache_dir, self.max_bytes, keep=path)
+
+
+# The columns of df that go into its fingerprint, with dates as int64 nanoseconds
+# (so the same dates always hash the same, whatever unit they're stored in).
+def _fingerprint_columns(df):
+    columns = {}
+    for col in FINGERPRINT_COLUMNS:
+        if (col not in df.columns):
+            continue
+        values = df[col].to_numpy()
+        if (values.dtype.kind == 'M'):
+            values = values.astype('datetime64[ns]').view(np.int64)
+        columns[col] = values
+    return columns
+
+
+# A string with every setting a scan depends on, including how each strat is defined,
+# so a strat registered again with different conditions isn't mistaken for the old one.
+def _settings_key(pds_to_incl, patterns, horizon, doji_limit):
+    return repr((pds_to_incl, horizon, float(doji_limit), [stoks.PATTERNS[name] for name in patterns]))
+
+
+# A hash of the ticker, the settings, and the bytes of every column.
+def _fingerprint(ticker, settings, columns):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((ticker, settings)).encode())
+    for col, values in columns.items():
+        values = np.ascontiguousarray(values)
+        digest.update(f'{col}:{values.dtype.str}:{len(values)};'.encode())
+        digest.update(values)
+    return digest.hexdigest()
+
+
+# The start of the name of every file saved for a ticker with the given settings.
+def _file_start(ticker, settings):
+    safe = ''.join(ch if ch.isalnum() or ch in '-.' else '_' for ch in ticker)
+    return f'{safe}_{hashlib.blake2b(settings.encode(), digest_size=4).hexdigest()}'
+
+
+# The (hits, succ) arrays of every strat, as 2D arrays with a row per strat.
+def _masks(o, h, l, c, ema, types, names, patterns, horizon):
+    arr = stoks.ScanArrays(o, h, l, c, ema, types, names, horizon)
+    masks = [stoks.PATTERNS[name].masks(arr) for name in patterns]
+    shape = (len(patterns), len(c))
+    hits = np.array([hits for hits, succ in masks], dtype=bool).reshape(shape)
+    succ = np.array([succ for hits, succ in masks], dtype=bool).reshape(shape)
+    return hits, succ
+
+
+# Works out a whole scan from scratch.
+def _compute(o, h, l, c, pds_to_incl, patterns, horizon, doji_limit):
+    ema = stoks.ema_array(c, pds_to_incl)
+    types, names = stoks.classify_candles(o, h, l, c, doji_limit)
+    return (ema, types, names) + _masks(o, h, l, c, ema, types, names, patterns, horizon)
+
+
+# The number of candles in the longest strat.
+def _longest(patterns):
+    return max((stoks.PATTERNS[name].num_candles for name in patterns), default=1)
+
+
+# The first row of a scan of length candles that new candles could change. A strat
+# dated on an earlier row only looks at candles (and their ema) that were already
+# there, up to its last candle plus the horizon.
+def _cut(length, patterns, horizon):
+    return length - _longest(patterns) - horizon + 1
+
+
+# Extends a cached scan of the first candles of o, h, l, and c to all of them.
+def _extend(prefix, o, h, l, c, pds_to_incl, patterns, horizon, doji_limit):
+    old_ema, old_types, old_names, old_hits, old_succ = prefix
+    n = len(old_ema)
+    total = len(c)
+    cut = _cut(n, patterns, horizon)
+
+    ema = stoks.extend_ema(old_ema, np.asarray(c[n:], dtype=float), pds_to_incl)
+    new_types, new_names = stoks.classify_candles(o[n:], h[n:], l[n:], c[n:], doji_limit)
+    types = np.concatenate([old_types, new_types])
+    names = np.concatenate([old_names, new_names])
+
+    # Runs the strats on only some rows and returns their (hits, succ) arrays.
+    def masks_on(rows):
+        return _masks(o[rows], h[rows], l[rows], c[rows], ema[rows], types[rows], names[rows],
+                      patterns, horizon)
+
+    # The rows from cut on, starting one row before it so each kept row's trend
+    # compares its ema to the one before it.
+    tail_hits, tail_succ = masks_on(np.arange(cut - 1, total))
+    hits = np.concatenate([old_hits[:, :cut], tail_hits[:, 1:]], axis=1)
+    succ = np.concatenate([old_succ[:, :cut], tail_succ[:, 1:]], axis=1)
+
+    # The first row's trend compares its ema to the last candle's (just like
+    # downtrend() and uptrend()), so it's worked out again with the new last candle.
+    head_hits, head_succ = masks_on(np.append(np.arange(_longest(patterns) + horizon), total - 1))
+    hits[:, 0] = head_hits[:, 0]
+    succ[:, 0] = head_succ[:, 0]
+    return ema, types, names, hits, succ
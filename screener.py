@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+import stoks
+
+
+# The fewest recent candles each ticker is screened on by default.
+LOOKBACK = 250
+
+# How many candles per ema period are screened on by default. The ema's starting
+# point fades by a factor of (1 - 2/(periods + 1)) each candle, so after 10 candles
+# per period it has shrunk to about e^-20 of what it was and older candles don't
+# change the answer. With fewer candles (like 250 with a 200 period ema, where about
+# 8% is left), the ema and so the trends can differ from a scan of the full history.
+LOOKBACK_PER_PERIOD = 10
+
+
+# The number of recent candles screen() uses by default for an ema of pds_to_incl periods.
+def lookback(pds_to_incl=9):
+    return max(LOOKBACK, LOOKBACK_PER_PERIOD * pds_to_incl)
+
+
+# Stock data on many tickers stacked into 2D arrays with a row per ticker and a
+# column per candle, lined up so the last column is each ticker's latest candle.
+# Tickers with fewer candles are padded on the left with nan.
+class StackedPrices:
+    def __init__(self, tickers, dates, o, h, l, c):
+        self.tickers = list(tickers)
+        # The date of each ticker's latest candle.
+        self.dates = dates
+        self.open, self.high, self.low, self.close = o, h, l, c
+
+
+# Stacks the last bars candles of each ticker. data maps each ticker to a
+# dataframe like get_stock_data()'s, or to a dict of arrays like PriceStore.arrays().
+def stack(data, bars=LOOKBACK):
+    tickers = list(data)
+    shape = (len(tickers), bars)
+    columns = {col: np.full(shape, np.nan) for col in ('Open', 'High', 'Low', 'Close')}
+    dates = np.full(len(tickers), np.datetime64('NaT'), dtype='datetime64[ns]')
+
+    for row, ticker in enumerate(tickers):
+        candles = data[ticker]
+        ticker_dates = np.asarray(candles['Date'])
+        if (len(ticker_dates) == 0):
+            continue
+        # Compact data stores dates as int64 nanoseconds.
+        last = ticker_dates[-1] if ticker_dates.dtype.kind == 'M' else int(ticker_dates[-1])
+        dates[row] = np.datetime64(last, 'ns')
+        for col, values in columns.items():
+            recent = np.asarray(candles[col])[-bars:]
+            values[row, bars - len(recent):] = recent
+
+    return StackedPrices(tickers, dates, columns['Open'], columns['High'], columns['Low'], columns['Close'])
+
+
+# Stacks tickers straight from a PriceStore, without loading their older candles.
+def stack_store(store, tickers=None, bars=LOOKBACK):
+    tickers = store.tickers() if tickers is None else tickers
+    return stack({ticker: store.arrays(ticker) for ticker in tickers}, bars)
+
+
+# The ema of every row of a 2D array of closing prices at once, working across
+# all the tickers one candle at a time. Each row starts at its first closing price
+# (after any nan padding), and the math is the same as stoks.ema_array()'s.
+def ema_2d(close, pds_to_incl=9):
+    smooth = 2 / (pds_to_incl + 1)
+    ema = np.empty_like(close, dtype=float)
+    prev = np.full(close.shape[0], np.nan)
+    for j in range(close.shape[1]):
+        price = close[:, j]
+        prev = np.where(np.isnan(prev), price, (price * smooth) + (prev * (1-smooth)))
+        ema[:, j] = prev
+    return ema
+
+
+# Finds which tickers printed each strat ending on their latest candle.
+# data is a StackedPrices, or anything stack() takes (which is stacked with
+# lookback(pds_to_incl) candles). A StackedPrices with fewer candles than that
+# gives an ema that can differ from a scan of the full history (see LOOKBACK_PER_PERIOD).
+# Returns a dataframe with a row per ticker, the date of its latest candle, and a
+# True/False column per strat. For example, the tickers that printed a hammer after
+# a downtrend today are screen(data).query('hammer').index.
+#
+# Only the last few candles are run through the strats. They're flattened into one
+# long array, a row of candles per ticker, so the same compiled strats in
+# stoks.PATTERNS run on every ticker at once. Each strat only looks at candles in
+# its own ticker's row, since each row has one more candle than the longest strat.
+def screen(data, pds_to_incl=9, doji_limit=stoks.DOJI_LIMIT, patterns=None):
+    if (not isinstance(data, StackedPrices)):
+        data = stack(data, lookback(pds_to_incl))
+    if (patterns is None):
+        patterns = list(stoks.PATTERNS)
+    patterns = [stoks.PATTERNS[name] for name in patterns]
+
+    ema = ema_2d(data.close, pds_to_incl)
+
+    # The last candles of every ticker, flattened into one row after another.
+    width = min(max(pattern.num_candles for pattern in patterns) + 1, data.close.shape[1])
+    o, h, l, c, e = (np.ascontiguousarray(values[:, -width:]).ravel()
+                     for values in (data.open, data.high, data.low, data.close, ema))
+    arr = stoks.ScanArrays(o, h, l, c, e, *stoks.classify_candles(o, h, l, c, doji_limit))
+
+    results = {'Date': data.dates}
+    for pattern in patterns:
+        first = width - pattern.num_candles
+        matches = pattern.matches(arr).reshape(len(data.tickers), width)
+        results[pattern.name] = matches[:, first] if first >= 1 else np.zeros(len(data.tickers), dtype=bool)
+    return pd.DataFrame(results, index=pd.Index(data.tickers, name='Ticker'))
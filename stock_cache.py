@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cache_files import evict, mark_used, merge_ranges, missing_ranges, npz_files, save_npz
+
+
+# The columns stored for every ticker, in the same order get_stock_data() returns them.
+COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+# Keeps downloaded stock data on disk so it only has to be fetched once.
+# Each ticker is saved as a .npz file holding one array per column, plus the
+# date ranges that have already been fetched (so weekends and holidays, which
+# have no candles, aren't fetched again). Only the parts of a requested date
+# range that haven't been fetched yet are downloaded, then merged into the file.
+#
+# fetcher is called as fetcher(ticker, start_date, end_date) and must return a
+# dataframe like get_stock_data() does. It defaults to stoks.get_stock_data, but
+# anything can be passed in, like a fake that reads local files for tests.
+# When the files take up more than max_bytes, the least recently used tickers
+# are deleted.
+class StockCache:
+    def __init__(self, cache_dir='stock_cache', fetcher=None, max_bytes=512 * 1024**2):
+        if (fetcher is None):
+            import stoks
+            fetcher = stoks.get_stock_data
+
+        self.cache_dir = cache_dir
+        self.fetcher = fetcher
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+    # Gets data on a ticker from the start date up to (but not including) the end
+    # date, the same range yf.download() uses.
+    def get(self, ticker, start_date, end_date):
+        start = _day(start_date)
+        end = _day(end_date)
+
+        data, covered = self._load(ticker)
+        missing = missing_ranges(covered, start, end)
+
+        # Fetches only the date ranges that aren't saved yet.
+        # Days from today on don't have (finished) candles yet, so they're never
+        # marked as fetched and are fetched again next time.
+        today = np.datetime64('today', 'D')
+        if (missing):
+            for miss_start, miss_end in missing:
+                fetched = self.fetcher(ticker, str(miss_start), str(miss_end))
+                data = _merge(data, _to_arrays(fetched))
+                if (miss_start < min(miss_end, today)):
+                    covered = merge_ranges(covered, miss_start, min(miss_end, today))
+            self._save(ticker, data, covered)
+            evict(self.cache_dir, self.max_bytes, keep=self._path(ticker))
+        elif (os.path.exists(self._path(ticker))):
+            mark_used(self._path(ticker))
+
+        # Only returns the candles in the requested range.
+        days = data['Date'].astype('datetime64[D]')
+        in_range = (days >= start) & (days < end)
+        return pd.DataFrame({col: data[col][in_range] for col in COLUMNS}, columns=COLUMNS)
+
+
+    # Deletes the saved data on one ticker, or on every ticker if none is given.
+    def clear(self, ticker=None):
+        names = [self._path(ticker)] if ticker is not None else self._files()
+        for path in names:
+            if (os.path.exists(path)):
+                os.remove(path)
+
+
+    # The number of bytes the saved data takes up.
+    def size(self):
+        return sum(os.path.getsize(path) for path in self._files())
+
+
+    # The file a ticker's data is saved in.
+    def _path(self, ticker):
+        safe = ''.join(ch if ch.isalnum() or ch in '-_.' else '_' for ch in ticker)
+        return os.path.join(self.cache_dir, safe + '.npz')
+
+
+    # Every file in the cache.
+    def _files(self):
+        return npz_files(self.cache_dir)
+
+
+    # Loads a ticker's saved arrays and fetched date ranges.
+    # Returns empty arrays if nothing is saved for it yet (or another process just
+    # evicted it).
+    def _load(self, ticker):
+        try:
+            with np.load(self._path(ticker)) as saved:
+                data = {col: saved[col] for col in COLUMNS}
+                covered = saved['covered']
+        except FileNotFoundError:
+            return _empty_arrays(), np.empty((0, 2), dtype='datetime64[D]')
+        return data, covered
+
+
+    # Saves a ticker's arrays and fetched date ranges.
+    def _save(self, ticker, data, covered):
+        save_npz(self._path(ticker), covered=covered, **data)
+
+
+# Turns a date (a string like '2022-12-21', a datetime, or a numpy datetime) into a day.
+def _day(date):
+    return np.datetime64(pd.Timestamp(date).date(), 'D')
+
+
+# Arrays for every column with no candles in them.
+def _empty_arrays():
+    data = {col: np.empty(0) for col in COLUMNS}
+    data['Date'] = np.empty(0, dtype='datetime64[ns]')
+    data['Volume'] = np.empty(0, dtype=np.int64)
+    return data
+
+
+# Turns a dataframe from the fetcher into a dict of arrays.
+def _to_arrays(df):
+    data = {col: df[col].to_numpy() for col in COLUMNS}
+    data['Date'] = data['Date'].astype('datetime64[ns]')
+    return data
+
+
+# Merges newly fetched candles into the saved ones, sorted by date.
+# If a date is in both, the new candle is kept.
+def _merge(old, new):
+    merged = {col: np.concatenate([new[col], old[col]]) for col in COLUMNS}
+    dates, first = np.unique(merged['Date'], return_index=True)
+    return {col: merged[col][first] for col in COLUMNS}
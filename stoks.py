@@ -1,11 +1,50 @@
-import yfinance as yf
-import pandas as pd
+import ast
+
+import numpy as np
+
+import instrument
+
+# yfinance and pandas are only imported in the functions that need them, so the
+# candle, ema, and strat math only loads numpy. This keeps `import stoks` fast for
+# short scripts and worker processes that scan data that's already downloaded.
 
 
 # Gets data from a specific stock and returns it in a dataframe.
-def get_stock_data(ticker, start_date, end_date):
+# If a cache (a stock_cache.StockCache) is given, the data comes from it and only
+# the dates it doesn't have yet are downloaded.
+# If compact is True, the dataframe uses much less memory (see compact_stock_data()).
+# If a store (a price_store.PriceStore) is given, the data is read from it, and
+# any dates in the range it hasn't fetched yet are downloaded (and, if the store
+# was opened to add to it, saved in it).
+@instrument.instrumented(bars=instrument.result_len)
+def get_stock_data(ticker, start_date, end_date, cache=None, compact=False, price_dtype='auto',
+                   store=None):
+    if (store is not None):
+        df = _store_stock_data(store, ticker, start_date, end_date, cache)
+        return compact_stock_data(df, price_dtype) if compact else df
+    
+    if (cache is not None):
+        df = cache.get(ticker, start_date, end_date)
+        return compact_stock_data(df, price_dtype) if compact else df
+    
     # Downloads historical data on the ticker from the start to end date.
-    data = yf.download(ticker, start_date, end_date)
+    import yfinance as yf
+    with instrument.stage('yf.download'):
+        data = yf.download(ticker, start_date, end_date)
+    
+    if (compact):
+        return compact_stock_data(data, price_dtype)
+
+    with instrument.stage('get_stock_data reshape', len(data.index)):
+        df = stock_frame(data)
+    
+    return df
+
+
+# Turns data from yfinance (with the dates as its index) into a dataframe like
+# get_stock_data()'s.
+def stock_frame(data):
+    import pandas as pd
 
     # Makes it so you can refer to the data on individuals dates by
     # their index number instead of a string representing the date.
@@ -14,14 +53,198 @@ def get_stock_data(ticker, start_date, end_date):
     data.reset_index(drop=True, inplace=True)
 
     # Turns the data into a pandas dataframe.
-    df = pd.DataFrame(data, columns = ['Date', 'Open', 'High', 'Low',
-                                       'Close', 'Adj Close', 'Volume'])
+    return pd.DataFrame(data, columns = ['Date', 'Open', 'High', 'Low',
+                                         'Close', 'Adj Close', 'Volume'])
+
+
+# Gets data on a ticker from a price store for get_stock_data(). Only the parts
+# of the date range that the store hasn't fetched yet (see PriceStore.covered())
+# are downloaded. If the store was opened to add to it, the new candles and the
+# fetched ranges are saved in it; days from today on are never marked as fetched,
+# since their candles aren't finished yet.
+def _store_stock_data(store, ticker, start_date, end_date, cache=None):
+    import pandas as pd
+    from cache_files import missing_ranges
+
+    start = np.datetime64(pd.Timestamp(start_date).date(), 'D')
+    end = np.datetime64(pd.Timestamp(end_date).date(), 'D')
+    covered = store.covered(ticker) if ticker in store else np.empty((0, 2), dtype='datetime64[D]')
+    missing = missing_ranges(covered, start, end)
+    fetched = [get_stock_data(ticker, str(miss_start), str(miss_end), cache)
+               for miss_start, miss_end in missing]
+
+    if (store.mode == 'a'):
+        if (fetched):
+            store.extend(ticker, pd.concat(fetched, ignore_index=True))
+            today = np.datetime64('today', 'D')
+            for miss_start, miss_end in missing:
+                if (miss_start < min(miss_end, today)):
+                    store.cover(ticker, miss_start, min(miss_end, today))
+        if (ticker in store):
+            return store.frame(ticker, start_date, end_date)
+
+    # A read only store can't save what was downloaded, so it's only merged in.
+    parts = ([store.frame(ticker, start_date, end_date)] if ticker in store else []) + fetched
+    if (not parts):
+        return get_stock_data(ticker, start_date, end_date, cache)
+    df = pd.concat(parts, ignore_index=True)
+    df['Date'] = df['Date'].astype('datetime64[ns]')
+    return df.drop_duplicates('Date', keep='last').sort_values('Date', kind='stable').reset_index(drop=True)
+
+
+# The columns of prices in stock data.
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close']
+
+# The most a price can change by when it's stored as a float32 in 'auto' mode.
+PRICE_TOLERANCE = 0.0005
+
+
+# Turns stock data (from yf.download() or get_stock_data()) into a dataframe that
+# uses as little memory as possible, copying each column only once:
+#   Date    - an int64 array of nanoseconds since 1970-01-01 (the epoch)
+#   prices  - float32 if price_dtype is 'auto' and none of the prices change by more
+#             than PRICE_TOLERANCE because of it, otherwise float64 (or whatever
+#             price_dtype is set to)
+#   Volume  - the smallest unsigned integer type that fits every volume
+#             (or volume_dtype if it's given)
+# The columns are in the same order as get_stock_data()'s.
+@instrument.instrumented(bars=instrument.result_len)
+def compact_stock_data(data, price_dtype='auto', volume_dtype=None):
+    import pandas as pd
+
+    if ('Date' in data.columns):
+        dates = data['Date'].to_numpy()
+    else:
+        dates = data.index.to_numpy()
+    columns = {'Date': dates.astype('datetime64[ns]').view(np.int64)}
+    
+    prices = {col: data[col].to_numpy() for col in PRICE_COLUMNS if col in data.columns}
+    if (price_dtype == 'auto'):
+        price_dtype = np.float32
+        for values in prices.values():
+            diff = np.abs(values.astype(np.float32).astype(float) - values)
+            if (len(values) and np.nanmax(diff, initial=0) > PRICE_TOLERANCE):
+                price_dtype = np.float64
+                break
+    for col, values in prices.items():
+        columns[col] = values.astype(price_dtype)
     
+    volume = data['Volume'].to_numpy()
+    if (volume_dtype is None):
+        volume_dtype = np.min_scalar_type(int(volume.max())) if len(volume) else np.uint8
+    columns['Volume'] = volume.astype(volume_dtype)
+    
+    return pd.DataFrame(columns, copy=False)
+
+
+# Gets the numpy arrays behind each column of stock data without copying them,
+# so they can be given straight to the vectorized functions.
+def stock_arrays(df):
+    return {col: df[col].to_numpy() for col in df.columns}
+
+
+# The percent of the total height a candle's body must be under for it to be a doji.
+# See candle_type() for how this was picked.
+DOJI_LIMIT = 0.12
+
+# The labels candle types and names are stored as. Each label's code is its index.
+CANDLE_TYPES = ('empty', 'doji', 'bull', 'bear')
+CANDLE_NAMES = ('idk', 'hammer', 'shooting star')
+EMPTY, DOJI, BULL, BEAR = range(len(CANDLE_TYPES))
+IDK, HAMMER, SHOOTING_STAR = range(len(CANDLE_NAMES))
+
+
+# Finds the body size, total size, and upper and lower shadow sizes of every candle,
+# and what percent of the total size the body and each shadow are.
+def candle_shapes(o, h, l, c):
+    shapes = {
+        'body': np.abs(c - o),
+        'total': h - l,
+        'upper': h - np.maximum(c, o),
+        'lower': np.minimum(c, o) - l,
+    }
+    
+    # Candles with a total size of 0 give nan or inf here, which classify_candles() handles.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for part in ('body', 'upper', 'lower'):
+            shapes[part + '_pct'] = shapes[part] / shapes['total']
+    return shapes
+
+
+# Classifies every candle at once.
+# Returns two int8 arrays: the candle type codes (see CANDLE_TYPES) and the candle
+# name codes (see CANDLE_NAMES), decided the same way as candle_type() and candle_name().
+# shapes can be passed in (from candle_shapes()) to reuse them for several doji limits.
+@instrument.instrumented(bars=instrument.first_arg_len)
+def classify_candles(o, h, l, c, doji_limit=DOJI_LIMIT, shapes=None):
+    if (shapes is None):
+        shapes = candle_shapes(o, h, l, c)
+    return classify_types(o, c, shapes, doji_limit), classify_names(shapes)
+
+
+# The candle type codes (see CANDLE_TYPES) from the shapes of the candles.
+def classify_types(o, c, shapes, doji_limit=DOJI_LIMIT):
+    return np.select([shapes['total'] == 0, shapes['body_pct'] <= doji_limit, c > o, c < o],
+                     [EMPTY, DOJI, BULL, BEAR], EMPTY).astype(np.int8)
+
+
+# The candle name codes (see CANDLE_NAMES) from the shapes of the candles.
+def classify_names(shapes):
+    body = shapes['body']
+    return np.select([(shapes['lower'] > body * 2) & (shapes['upper_pct'] < 0.1),
+                      (shapes['upper'] > body * 2) & (shapes['lower_pct'] < 0.1)],
+                     [HAMMER, SHOOTING_STAR], IDK).astype(np.int8)
+
+
+# Adds 'Candle Type' and 'Candle Name' int8 columns to df so every vectorized
+# strat can share them instead of classifying the candles again.
+def add_candle_columns(df, doji_limit=DOJI_LIMIT):
+    types, names = classify_candles(*ohlc_arrays(df), doji_limit)
+    df['Candle Type'] = types
+    df['Candle Name'] = names
     return df
 
 
-# Determines if a candle is bullish (returns bull), bearish (bear), or a doji (doji).
-def candle_type(candle):
+# Gets the candle type and name codes of df, using its candle columns if it has them.
+def candle_codes(df):
+    if ('Candle Type' in df.columns and 'Candle Name' in df.columns):
+        return df['Candle Type'].to_numpy(), df['Candle Name'].to_numpy()
+    return classify_candles(*ohlc_arrays(df))
+
+
+# Classifies a single candle, deciding its type and name the same way as
+# classify_types() and classify_names(). It uses plain Python math since the row
+# by row Strats call it on every candle, and numpy is slow one number at a time.
+def _classify_candle(candle, doji_limit=DOJI_LIMIT):
+    o, h, l, c = (float(candle[col]) for col in ('Open', 'High', 'Low', 'Close'))
+    body = abs(c - o)
+    total = h - l
+    upper = h - max(c, o)
+    lower = min(c, o) - l
+
+    if (total == 0):
+        kind = EMPTY
+    elif (body / total <= doji_limit):
+        kind = DOJI
+    elif (c > o):
+        kind = BULL
+    elif (c < o):
+        kind = BEAR
+    else:
+        kind = EMPTY
+
+    if (total != 0 and lower > body * 2 and upper / total < 0.1):
+        name = HAMMER
+    elif (total != 0 and upper > body * 2 and lower / total < 0.1):
+        name = SHOOTING_STAR
+    else:
+        name = IDK
+    return CANDLE_TYPES[kind], CANDLE_NAMES[name]
+
+
+# Determines if a candle is bullish (returns bull), bearish (bear), a doji (doji),
+# or has no size at all (empty).
+def candle_type(candle, doji_limit=DOJI_LIMIT):
     '''
     There are 2 main methods I found to determine if a candle is a doji.
     Both utilize a variable, doji_limit, that's a percent.
@@ -43,72 +266,20 @@ def candle_type(candle):
     to $33,376. For this method, a doji_limit value between 10% and 14% seems to
     be work the best.
     '''
-    
-    DOJI_LIMIT = 0.12
-    
-    body_size = abs(candle['Open'] - candle['Close'])
-    total_size = candle['High'] - candle['Low']
-    
-    if (total_size == 0):
-        # The low, high, open, and close are all the same.
-        # This is extremely rare but technically not impossible, 
-        # so this case exists to ensure no ZeroDivisionError.
-        return 'empty'
-    elif (body_size / total_size <= DOJI_LIMIT):
-        # It's a doji.
-        return 'doji'
-    elif (candle['Close'] > candle['Open']):
-        # It's bullish.
-        return 'bull'
-    elif (candle['Close'] < candle['Open']):
-        # It's bearish.
-        return 'bear'
+    return _classify_candle(candle, doji_limit)[0]
 
 
 # Determines the specific type of candle a candle is.
 def candle_name(candle):
-    # The size of the body.
-    size_body = abs(candle['Close'] - candle['Open'])
-    
-    # The total size of the candle.
-    size_total = candle['High'] - candle['Low']
-    
-    # The size of the upper shadow.
-    size_upper = candle['High'] - max(candle['Close'], candle['Open'])
-    
-    # The size of the lower shadow.
-    size_lower = min(candle['Close'], candle['Open']) - candle['Low']
-    
-    
-    # Determines the candle name.
-    if (size_lower > size_body * 2 and size_upper / size_total < 0.1):
-        return 'hammer'
-    elif (size_upper > size_body * 2 and size_lower / size_total < 0.1):
-        return 'shooting star'
-
-    return 'idk'
+    return _classify_candle(candle)[1]
 
 
 # Function to find the number of doji, bullish candles, and bearish candles.
 def find_all_candle_types(df):
-    # the number of each type of candle
-    num_doji = 0
-    num_bull = 0
-    num_bear = 0
-    
-    # Runs for every row in df.
-    for i in range(len(df.index)):
-        if (candle_type(df.iloc[i]) == 'bull'):
-            # Increases num_bull by one. 
-            num_bull += 1
-        elif (candle_type(df.iloc[i]) == 'bear'):
-            # Increases num_bear by one. 
-            num_bear += 1
-        elif (candle_type(df.iloc[i]) == 'doji'):
-            # Increases num_doji by one.
-            num_doji += 1
-            
-    return [['Bullish', num_bull], ['Bearish', num_bear], ['Doji', num_doji]]
+    # The number of each type of candle.
+    counts = np.bincount(candle_codes(df)[0], minlength=len(CANDLE_TYPES))
+    
+    return [['Bullish', int(counts[BULL])], ['Bearish', int(counts[BEAR])], ['Doji', int(counts[DOJI])]]
 
 
 # Determines if there is a downtrend before this candle.
@@ -156,27 +327,69 @@ def is_succ(ema, candle_index, strat_type):
 # It is calculated by taking a certain number of periods (e.g., 12, 26, 50) of the
 # stock's price and weighting them exponentially. The most recent periods are given
 # a higher weight, while older periods are given a lower weight.
-def ema(df):
-    # The number of periods to include.
-    pds_to_incl = 9
+# pds_to_incl can be one number of periods or a list of them. The result is a numpy
+# array that downtrend(), uptrend(), and is_succ() take as is.
+@instrument.instrumented(bars=instrument.first_arg_len)
+def ema(df, pds_to_incl=9):
+    return ema_array(df['Close'].to_numpy(dtype=float), pds_to_incl)
+
+
+# Finds the exponential moving average of an array of closing prices.
+# Returns a 1D array for one number of periods, or a 2D array with a row per
+# number of periods if pds_to_incl is a list.
+def ema_array(close, pds_to_incl=9):
+    close = np.asarray(close, dtype=float)
+    num_pds = len(np.atleast_1d(pds_to_incl))
     
-    # The smoothing factor.
-    smooth = 2 / (pds_to_incl + 1)
+    if (len(close) == 0):
+        return _ema_shape(np.empty((num_pds, 0)), pds_to_incl)
     
-    # A list storing the ema.
     # The first ema will just be the first candle's closing price.
-    ema = [df.iloc[0]['Close']]
+    first = np.full((num_pds, 1), close[0])
+    return extend_ema(first, close[1:], pds_to_incl)
+
+
+# Extends an existing ema (from ema() or ema_array()) with the closing prices of
+# new candles. Only the new candles are calculated, starting from the last ema.
+# An empty ema (like a new series that candles are being streamed into) starts
+# from the first new closing price, the same as ema_array().
+def extend_ema(ema, new_close, pds_to_incl=9):
+    ema = np.asarray(ema, dtype=float)
+    new_close = np.asarray(new_close, dtype=float)
+    
+    # The smoothing factor for each number of periods.
+    smooth = 2 / (np.atleast_1d(pds_to_incl).astype(float) + 1)
     
-    # Runs for every candle except the first one.
-    for i in range(1, len(df.index)):
-        ema.append((df.iloc[i]['Close'] * smooth) + (ema[i-1] * (1-smooth)))
+    # One row per number of periods.
+    rows = np.atleast_2d(ema)
+    if (rows.shape[1] == 0):
+        return ema_array(new_close, pds_to_incl)
+    tail = np.empty((len(smooth), len(new_close)))
+    
+    for j in range(len(smooth)):
+        # Plain floats are much faster than numpy scalars for a recurrence like this,
+        # and do the exact same math as the original row by row calculation.
+        s = float(smooth[j])
+        prev = float(rows[j, -1])
+        out = []
+        for price in new_close.tolist():
+            prev = (price * s) + (prev * (1-s))
+            out.append(prev)
+        tail[j] = out
+    
+    return _ema_shape(np.concatenate([rows, tail], axis=1), pds_to_incl)
+
 
-    # Returns a list of the ema for each candle.
-    return ema
+# Drops the extra dimension from an ema if only one number of periods was given.
+def _ema_shape(rows, pds_to_incl):
+    if (np.ndim(pds_to_incl) == 0):
+        return rows.reshape(-1)
+    return np.atleast_2d(rows)
 
 
 # Candlestick strategies.
 class Strats:
+    @instrument.instrumented(bars=instrument.first_arg_len)
     def bullish_engulfing(df, ema):
         # The dates where this strategy occurs, succeeds, and fails.
         dates = []
@@ -218,6 +431,7 @@ class Strats:
         return succ_rate
     
     
+    @instrument.instrumented(bars=instrument.first_arg_len)
     def bearish_engulfing(df, ema):
         # The dates where this strategy occurs, succeeds, and fails.
         dates = []
@@ -259,6 +473,7 @@ class Strats:
         return succ_rate
     
     
+    @instrument.instrumented(bars=instrument.first_arg_len)
     def piercing(df, ema):
         # The dates where this strategy occurs, succeeds, and fails.
         dates = []
@@ -306,6 +521,7 @@ class Strats:
         return succ_rate
     
     
+    @instrument.instrumented(bars=instrument.first_arg_len)
     def dark_cloud_cover(df, ema):
         # The dates where this strategy occurs, succeeds, and fails.
         dates = []
@@ -353,6 +569,7 @@ class Strats:
         return succ_rate
     
     
+    @instrument.instrumented(bars=instrument.first_arg_len)
     def hammer(df, ema):
         # The dates where this strategy occurs, succeeds, and fails.
         dates = []
@@ -392,6 +609,7 @@ class Strats:
         return succ_rate
     
     
+    @instrument.instrumented(bars=instrument.first_arg_len)
     def shooting_star(df, ema):
         # The dates where this strategy occurs, succeeds, and fails.
         dates = []
@@ -432,3 +650,578 @@ class Strats:
     
     
 
+
+# Pulls the open, high, low, and close columns out of df as float arrays.
+# Float columns (like the float32 ones from compact_stock_data()) are used as is
+# without copying them.
+def ohlc_arrays(df):
+    arrays = []
+    for col in ('Open', 'High', 'Low', 'Close'):
+        values = df[col].to_numpy()
+        arrays.append(values if values.dtype.kind == 'f' else values.astype(float))
+    return tuple(arrays)
+
+
+# Shifts an array back by n candles so index i holds the value from candle i+n.
+# The last n slots are filled with nan (or False for boolean arrays), which fails
+# every comparison.
+def _next(arr, n=1):
+    if (arr.dtype == bool):
+        shifted = np.zeros(len(arr), dtype=bool)
+    else:
+        shifted = np.full(len(arr), np.nan)
+    shifted[:max(len(arr)-n, 0)] = arr[n:]
+    return shifted
+
+
+# Boolean arrays of whether there's a downtrend and an uptrend before each candle.
+# Just like downtrend() and uptrend(), the first candle is compared to the last one.
+def trend_masks(ema):
+    ema = np.asarray(ema, dtype=float)
+    prev = np.roll(ema, 1)
+    return ema < prev, ema > prev
+
+
+# Boolean arrays of whether a bullish and a bearish strat ending on each candle
+# is successful, the same way is_succ() decides it. is_succ() looks 2 candles
+# ahead, but any horizon can be used. Candles without enough candles following
+# them are never successful.
+def succ_masks(ema, horizon=2):
+    ema = np.asarray(ema, dtype=float)
+    later = _next(ema, horizon)
+    return later > ema, later < ema
+
+
+# Boolean array of the candles a strat loop visits, from the first candle up to
+# (but not including) the last num_following candles.
+def _in_range(length, num_following):
+    valid = np.zeros(length, dtype=bool)
+    valid[:max(length - num_following, 0)] = True
+    return valid
+
+
+# Gets the dates a strat occurs, succeeds, and fails on from its masks.
+def hit_dates(df, hits, succ):
+    dates = df['Date'].to_numpy()
+    return dates[hits], dates[hits & succ], dates[hits & ~succ]
+
+
+# The success rate of a strat from its masks.
+# Like the loops in Strats, this raises a ZeroDivisionError if the strat never occurs.
+def masks_succ_rate(hits, succ):
+    return int(np.count_nonzero(hits & succ)) / int(np.count_nonzero(hits))
+
+
+# The columns a strat's conditions can use. Each can be indexed by candle, like
+# close[1] for the close of the strat's second candle (just close means close[0]).
+#   open, high, low, close, ema       - prices and the ema
+#   body, total, upper, lower         - candle sizes (see candle_shapes())
+#   body_pct, upper_pct, lower_pct    - sizes as a percent of the total size
+#   empty, doji, bull, bear           - the candle's type
+#   hammer, shooting_star             - the candle's name
+#   down, up                          - whether there's a downtrend or uptrend before the candle
+PATTERN_COLUMNS = ('open', 'high', 'low', 'close', 'ema',
+                   'body', 'total', 'upper', 'lower', 'body_pct', 'upper_pct', 'lower_pct',
+                   'empty', 'doji', 'bull', 'bear', 'hammer', 'shooting_star', 'down', 'up')
+
+# Functions a strat's conditions can use.
+PATTERN_FUNCTIONS = {'abs': np.abs, 'maximum': np.maximum, 'minimum': np.minimum}
+
+
+# Everything the vectorized strats need for a whole set of candles, worked out the
+# first time a strat asks for it and then shared by every strat.
+# types and names are the candle codes from classify_candles(), and horizon is how
+# many candles after a strat its outcome is decided on.
+class ScanArrays:
+    def __init__(self, o, h, l, c, ema, types, names, horizon=2):
+        self.length = len(c)
+        self.horizon = horizon
+        self.ema = np.asarray(ema, dtype=float)
+        self.columns = {'open': o, 'high': h, 'low': l, 'close': c, 'ema': self.ema}
+        
+        # Columns that are only worked out if a strat needs them.
+        self._shapes = None
+        
+        # Every shifted column and condition that's been worked out, so strats that
+        # use the same ones share them.
+        self._cache = {}
+        
+        self.columns['hammer'] = names == HAMMER
+        self.columns['shooting_star'] = names == SHOOTING_STAR
+        self.set_types(types)
+    
+    
+    # Swaps in new candle type codes (like ones from a different doji limit),
+    # throwing away anything worked out from the old ones.
+    def set_types(self, types):
+        for code, name in ((EMPTY, 'empty'), (DOJI, 'doji'), (BULL, 'bull'), (BEAR, 'bear')):
+            self.columns[name] = types == code
+        self._cache = {key: value for key, value in self._cache.items()
+                       if not _uses_types(key)}
+    
+    
+    # A column shifted so index i holds the value from candle i+offset.
+    def get(self, name, offset=0):
+        key = (name, offset)
+        if (key not in self._cache):
+            self._cache[key] = _next(self._column(name), offset) if offset else self._column(name)
+        return self._cache[key]
+    
+    
+    # An unshifted column, working it out if this is the first time it's used.
+    def _column(self, name):
+        if (name not in self.columns):
+            if (name in ('down', 'up')):
+                self.columns['down'], self.columns['up'] = trend_masks(self.ema)
+            elif (name in ('bull_succ', 'bear_succ')):
+                self.columns['bull_succ'], self.columns['bear_succ'] = succ_masks(self.ema, self.horizon)
+            else:
+                if (self._shapes is None):
+                    self._shapes = candle_shapes(*(self.columns[col] for col in ('open', 'high', 'low', 'close')))
+                self.columns[name] = self._shapes[name]
+        return self.columns[name]
+    
+    
+    # The candles the strat loops in Strats visit for a strat with num_candles candles:
+    # every candle that has num_candles - 1 more candles after it, plus horizon
+    # candles after those to decide the outcome.
+    def in_range(self, num_candles):
+        key = ('in_range', num_candles)
+        if (key not in self._cache):
+            self._cache[key] = _in_range(self.length, self.horizon + num_candles - 1)
+        return self._cache[key]
+    
+    
+    # Evaluates a compiled condition, or gets it from the cache if another strat
+    # already evaluated the same one.
+    def evaluate(self, condition):
+        key = ('condition', condition.key)
+        if (key not in self._cache):
+            self._cache[key] = eval(condition.code, {'__builtins__': {}}, _Namespace(self))
+        return self._cache[key]
+
+
+# Whether something cached by a ScanArrays depends on the candle types.
+def _uses_types(key):
+    if (key[0] == 'condition'):
+        return True
+    return key[0] in ('empty', 'doji', 'bull', 'bear')
+
+
+# Looks up the names in a compiled condition: close__1 is the close column shifted
+# by 1 candle, and the names in PATTERN_FUNCTIONS are the functions.
+class _Namespace(dict):
+    def __init__(self, arr):
+        super().__init__(PATTERN_FUNCTIONS)
+        self.arr = arr
+    
+    def __missing__(self, name):
+        column, offset = name.rsplit('__', 1)
+        return self.arr.get(column, int(offset))
+
+
+# Works out the ScanArrays of a dataframe.
+def scan_arrays(df, ema, horizon=2):
+    return ScanArrays(*ohlc_arrays(df), ema, *candle_codes(df), horizon)
+
+
+# A condition of a strat, compiled from a string like 'open[1] < close[0]' into
+# code that works on whole columns at once.
+# and, or, and not work like &, |, and ~, and chained comparisons like
+# 'low[1] < close[0] < high[1]' are split into two comparisons joined with &.
+class _Condition:
+    def __init__(self, source, num_candles):
+        tree = _ConditionCompiler(source, num_candles).visit(ast.parse(source, mode='eval'))
+        ast.fix_missing_locations(tree)
+        self.source = source
+        # Conditions that compile to the same thing share their result.
+        self.key = ast.dump(tree)
+        self.code = compile(tree, f'<condition {source!r}>', 'eval')
+
+
+# Turns the ast of a condition into one that works on whole columns.
+class _ConditionCompiler(ast.NodeTransformer):
+    def __init__(self, source, num_candles):
+        self.source = source
+        self.num_candles = num_candles
+    
+    def _column(self, name, offset, node):
+        if (name not in PATTERN_COLUMNS):
+            raise ValueError(f'unknown column {name!r} in condition {self.source!r}')
+        if (not isinstance(offset, int) or not 0 <= offset < self.num_candles):
+            raise ValueError(f'{name}[{offset}] in condition {self.source!r} is not one of '
+                             f'the strat\'s {self.num_candles} candles')
+        return ast.copy_location(ast.Name(id=f'{name}__{offset}', ctx=ast.Load()), node)
+    
+    def visit_Subscript(self, node):
+        if (isinstance(node.value, ast.Name) and isinstance(node.slice, ast.Constant)):
+            return self._column(node.value.id, node.slice.value, node)
+        raise ValueError(f'only columns like close[1] can be indexed in condition {self.source!r}')
+    
+    def visit_Name(self, node):
+        if (node.id in PATTERN_FUNCTIONS):
+            return node
+        return self._column(node.id, 0, node)
+    
+    def visit_BoolOp(self, node):
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [self.visit(value) for value in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return ast.copy_location(result, node)
+    
+    def visit_UnaryOp(self, node):
+        if (isinstance(node.op, ast.Not)):
+            return ast.copy_location(ast.UnaryOp(op=ast.Invert(), operand=self.visit(node.operand)), node)
+        return self.generic_visit(node)
+    
+    def visit_Compare(self, node):
+        node = self.generic_visit(node)
+        if (len(node.ops) == 1):
+            return node
+        operands = [node.left] + node.comparators
+        result = None
+        for op, left, right in zip(node.ops, operands, operands[1:]):
+            compare = ast.Compare(left=left, ops=[op], comparators=[right])
+            result = compare if result is None else ast.BinOp(left=result, op=ast.BitAnd(), right=compare)
+        return ast.copy_location(result, node)
+    
+    def generic_visit(self, node):
+        if (isinstance(node, (ast.Call, ast.Attribute, ast.Lambda, ast.NamedExpr))
+                and not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                         and node.func.id in PATTERN_FUNCTIONS)):
+            raise ValueError(f'{type(node).__name__} is not allowed in condition {self.source!r}')
+        return super().generic_visit(node)
+
+
+# A candlestick strat, declared as conditions on its candles instead of a loop.
+#   num_candles - the number of candles in the strat
+#   direction   - 'bull' if the strat expects the ema to rise afterwards, 'bear' if it expects it to fall
+#   conditions  - strings that must all be true, like 'bear[0]' or 'open[1] < close[0]'
+#                 (see PATTERN_COLUMNS for what they can use)
+#   trend       - 'down' or 'up' if there must be that trend before the first candle
+# The strat is dated on its first candle, and its outcome is decided horizon
+# candles after its last candle, the same way is_succ() does.
+class Pattern:
+    def __init__(self, name, num_candles, direction, conditions, trend=None):
+        if (direction not in ('bull', 'bear')):
+            raise ValueError(f"direction must be 'bull' or 'bear', not {direction!r}")
+        if (trend not in (None, 'down', 'up')):
+            raise ValueError(f"trend must be 'down', 'up', or None, not {trend!r}")
+        
+        self.name = name
+        self.num_candles = num_candles
+        self.direction = direction
+        self.trend = trend
+        self.conditions = list(conditions)
+        self._compiled = [_Condition(condition, num_candles) for condition in self.conditions]
+        if (trend is not None):
+            self._compiled.insert(0, _Condition(f'{trend}[0]', num_candles))
+    
+    
+    # A boolean array marking the first candle of every place the strat's trend
+    # and conditions are all true, ignoring whether its outcome can be decided.
+    def matches(self, arr):
+        mask = np.ones(arr.length, dtype=bool)
+        for condition in self._compiled:
+            mask = mask & arr.evaluate(condition)
+        return mask
+    
+    
+    # Two boolean arrays: the first marks the candle every occurrence of the strat
+    # is dated on, the second marks the occurrences that are successful.
+    def masks(self, arr):
+        hits = self.matches(arr) & arr.in_range(self.num_candles)
+        return hits, hits & arr.get(self.direction + '_succ', self.num_candles - 1)
+    
+    
+    def __repr__(self):
+        return (f'Pattern({self.name!r}, {self.num_candles}, {self.direction!r}, '
+                f'{self.conditions!r}, trend={self.trend!r})')
+
+
+# The strats scan() runs, by name. Every strat here is found in the same sweep,
+# sharing the columns and conditions they have in common.
+PATTERNS = {}
+
+
+# Adds a strat to PATTERNS (replacing any with the same name) and returns it.
+# For example, a morning star could be added with:
+#   register_pattern('morning_star', 3, 'bull',
+#                    ['bear[0]', 'body_pct[1] < 0.3', 'bull[2]',
+#                     'close[2] > close[0] + ((open[0] - close[0]) / 2)'], trend='down')
+def register_pattern(name, num_candles, direction, conditions, trend=None):
+    pattern = Pattern(name, num_candles, direction, conditions, trend)
+    PATTERNS[name] = pattern
+    return pattern
+
+
+# A bearish candle after a downtrend, then one that opens below and closes above its body.
+register_pattern('bullish_engulfing', 2, 'bull',
+                 ['bear[0]', 'open[1] < close[0]', 'close[1] > open[0]'], trend='down')
+
+# A bullish candle after an uptrend, then one that opens above and closes below its body.
+register_pattern('bearish_engulfing', 2, 'bear',
+                 ['bull[0]', 'open[1] > close[0]', 'close[1] < open[0]'], trend='up')
+
+# A bearish candle after a downtrend, then one that opens below its bottom (close)
+# and closes above the middle of its body.
+register_pattern('piercing', 2, 'bull',
+                 ['bear[0]', 'open[1] < close[0]',
+                  'close[1] > close[0] + ((open[0] - close[0]) / 2)'], trend='down')
+
+# A bullish candle after an uptrend, then one that opens above its top (close)
+# and closes below the middle of its body.
+register_pattern('dark_cloud_cover', 2, 'bear',
+                 ['bull[0]', 'open[1] > close[0]',
+                  'close[1] < open[0] + ((close[0] - open[0]) / 2)'], trend='up')
+
+# A hammer after a downtrend.
+register_pattern('hammer', 1, 'bull', ['hammer[0]'], trend='down')
+
+# A shooting star after a downtrend (the same trend Strats.shooting_star checks).
+register_pattern('shooting_star', 1, 'bear', ['shooting_star[0]'], trend='down')
+
+
+# What direction a strat expects, as stored in an EventTable.
+DIRECTIONS = {'bull': 1, 'bear': -1}
+
+
+# Every occurrence of every strat, stored as one array per column so it takes up
+# little memory and can be joined with other tables quickly.
+# The columns are:
+#   ticker    - the code of the ticker (its index in tickers)
+#   index     - the row in the dataframe of the strat's first candle
+#   date      - the date of the strat's first candle
+#   pattern   - the code of the strat (its index in pattern_names)
+#   direction - 1 for bullish strats and -1 for bearish ones
+#   succ      - whether the strat was successful
+class EventTable:
+    COLUMNS = ['ticker', 'index', 'date', 'pattern', 'direction', 'succ']
+    
+    def __init__(self, ticker, index, date, pattern, direction, succ,
+                 pattern_names=None, tickers=('',)):
+        if (pattern_names is None):
+            pattern_names = tuple(PATTERNS)
+        
+        self.ticker = np.asarray(ticker, dtype=np.int32)
+        self.index = np.asarray(index, dtype=np.int64)
+        self.date = np.asarray(date, dtype='datetime64[ns]')
+        self.pattern = np.asarray(pattern, dtype=np.int16)
+        self.direction = np.asarray(direction, dtype=np.int8)
+        self.succ = np.asarray(succ, dtype=bool)
+        self.pattern_names = tuple(pattern_names)
+        self.tickers = tuple(tickers)
+    
+    
+    # Builds the table from the (hits, succ) arrays of each strat.
+    def from_masks(dates, masks, ticker=''):
+        pattern_names = tuple(PATTERNS)
+        index, pattern, succ = [], [], []
+        for name, (hits, succ_mask) in masks.items():
+            rows = np.flatnonzero(hits)
+            index.append(rows)
+            pattern.append(np.full(len(rows), pattern_names.index(name), dtype=np.int16))
+            succ.append(succ_mask[rows])
+        
+        index = np.concatenate(index) if index else np.empty(0, dtype=np.int64)
+        pattern = np.concatenate(pattern) if pattern else np.empty(0, dtype=np.int16)
+        succ = np.concatenate(succ) if succ else np.empty(0, dtype=bool)
+        
+        # Sorts the events by the candle they happen on.
+        order = np.argsort(index, kind='stable')
+        index, pattern, succ = index[order], pattern[order], succ[order]
+        
+        direction_codes = np.array([DIRECTIONS[PATTERNS[name].direction] for name in pattern_names], dtype=np.int8)
+        return EventTable(np.zeros(len(index)), index, np.asarray(dates)[index], pattern,
+                          direction_codes[pattern], succ, pattern_names, (ticker,))
+    
+    
+    # Joins several tables (like one per ticker) into one.
+    # Strat and ticker codes are matched up by name, so the tables don't need to
+    # have the same pattern_names or tickers.
+    def concat(tables):
+        tables = list(tables)
+        pattern_names = list(dict.fromkeys(name for table in tables for name in table.pattern_names))
+        tickers = list(dict.fromkeys(ticker for table in tables for ticker in table.tickers))
+        
+        columns = {col: [] for col in EventTable.COLUMNS}
+        for table in tables:
+            # Maps this table's codes to the codes of the joined table.
+            pattern_map = np.array([pattern_names.index(name) for name in table.pattern_names], dtype=np.int16)
+            ticker_map = np.array([tickers.index(ticker) for ticker in table.tickers], dtype=np.int32)
+            columns['ticker'].append(ticker_map[table.ticker])
+            columns['pattern'].append(pattern_map[table.pattern])
+            for col in ('index', 'date', 'direction', 'succ'):
+                columns[col].append(getattr(table, col))
+        
+        if (not tables):
+            return EventTable([], [], [], [], [], [], (), ())
+        return EventTable(*(np.concatenate(columns[col]) for col in EventTable.COLUMNS),
+                          pattern_names, tickers)
+    
+    
+    def __len__(self):
+        return len(self.index)
+    
+    
+    # A table with only the rows where mask is True.
+    def filter(self, mask):
+        return EventTable(*(getattr(self, col)[mask] for col in EventTable.COLUMNS),
+                          self.pattern_names, self.tickers)
+    
+    
+    # A table with only the events of one strat.
+    def select(self, name):
+        if (name not in self.pattern_names):
+            return self.filter(np.zeros(len(self), dtype=bool))
+        return self.filter(self.pattern == self.pattern_names.index(name))
+    
+    
+    # The success rate of a strat, or of every event if no strat is given.
+    # Like the loops in Strats, this raises a ZeroDivisionError if the strat never occurs.
+    def succ_rate(self, name=None):
+        events = self if name is None else self.select(name)
+        return int(np.count_nonzero(events.succ)) / len(events)
+    
+    
+    # A dataframe with the count, success count, and success rate (nan if it never
+    # occurs) of each strat for each ticker.
+    def summary(self):
+        import pandas as pd
+
+        counts = np.zeros((len(self.tickers), len(self.pattern_names)), dtype=np.int64)
+        succ_counts = np.zeros_like(counts)
+        np.add.at(counts, (self.ticker, self.pattern), 1)
+        np.add.at(succ_counts, (self.ticker, self.pattern), self.succ)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = succ_counts / counts
+        index = pd.MultiIndex.from_product([self.tickers, self.pattern_names], names=['Ticker', 'Strat'])
+        return pd.DataFrame({'Count': counts.ravel(), 'Successes': succ_counts.ravel(),
+                             'Success Rate': rates.ravel()}, index=index)
+    
+    
+    # The events as a dataframe, with the ticker, strat, and direction as labels.
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame({
+            'Ticker': pd.Categorical.from_codes(self.ticker, self.tickers),
+            'Index': self.index,
+            'Date': self.date,
+            'Strat': pd.Categorical.from_codes(self.pattern, self.pattern_names),
+            'Direction': np.where(self.direction > 0, 'bull', 'bear'),
+            'Success': self.succ,
+        })
+
+
+# The results of running every strat over a dataframe at once.
+# counts and succ_counts have the number of times each strat occurs and succeeds,
+# masks has the (hits, succ) arrays each strat found, and events has every
+# occurrence in an EventTable. horizon is how many candles after each strat its
+# outcome was decided on.
+class ScanResult:
+    def __init__(self, dates, masks, ticker='', horizon=2):
+        self.dates = dates
+        self.masks = masks
+        self.horizon = horizon
+        self.events = EventTable.from_masks(dates, masks, ticker)
+        self.counts = {name: int(np.count_nonzero(hits)) for name, (hits, succ) in masks.items()}
+        self.succ_counts = {name: int(np.count_nonzero(succ)) for name, (hits, succ) in masks.items()}
+    
+    
+    # The success rate of a strat.
+    # Like the loops in Strats, this raises a ZeroDivisionError if the strat never occurs.
+    def succ_rate(self, name):
+        return self.events.succ_rate(name)
+    
+    
+    # The dates a strat occurs, succeeds, and fails on.
+    def hit_dates(self, name):
+        hits, succ = self.masks[name]
+        return self.dates[hits], self.dates[succ], self.dates[hits & ~succ]
+    
+    
+    # A dataframe with a row per strat and its count, success count, and success
+    # rate (nan if it never occurs).
+    def summary(self):
+        import pandas as pd
+
+        rows = [[name, self.counts[name], self.succ_counts[name],
+                 self.succ_counts[name] / self.counts[name] if self.counts[name] else np.nan]
+                for name in self.masks]
+        return pd.DataFrame(rows, columns=['Strat', 'Count', 'Successes', 'Success Rate']).set_index('Strat')
+
+
+# Runs every strat in PATTERNS (or just the names in patterns) over df in one sweep.
+# The shared arrays are only worked out once no matter how many strats there are.
+# horizon is how many candles after a strat its outcome is decided on.
+@instrument.instrumented(bars=instrument.first_arg_len)
+def scan(df, ema, patterns=None, ticker='', horizon=2):
+    if (patterns is None):
+        patterns = list(PATTERNS)
+    arr = scan_arrays(df, ema, horizon)
+    masks = {name: PATTERNS[name].masks(arr) for name in patterns}
+    return ScanResult(df['Date'].to_numpy(), masks, ticker, horizon)
+
+
+# Vectorized versions of the candlestick strategies in Strats.
+# Each *_masks method returns the (hits, succ) arrays of the strat (see PATTERNS).
+# The other methods return the same success rate as their Strats counterpart,
+# which is kept as the reference implementation.
+# To run more than one strat, scan() is faster since it shares the work between them.
+class VecStrats:
+    def bullish_engulfing_masks(df, ema):
+        return PATTERNS['bullish_engulfing'].masks(scan_arrays(df, ema))
+    
+    
+    def bearish_engulfing_masks(df, ema):
+        return PATTERNS['bearish_engulfing'].masks(scan_arrays(df, ema))
+    
+    
+    def piercing_masks(df, ema):
+        return PATTERNS['piercing'].masks(scan_arrays(df, ema))
+    
+    
+    def dark_cloud_cover_masks(df, ema):
+        return PATTERNS['dark_cloud_cover'].masks(scan_arrays(df, ema))
+    
+    
+    def hammer_masks(df, ema):
+        return PATTERNS['hammer'].masks(scan_arrays(df, ema))
+    
+    
+    def shooting_star_masks(df, ema):
+        return PATTERNS['shooting_star'].masks(scan_arrays(df, ema))
+    
+    
+    @instrument.instrumented(bars=instrument.first_arg_len)
+    def bullish_engulfing(df, ema):
+        return masks_succ_rate(*VecStrats.bullish_engulfing_masks(df, ema))
+    
+    
+    @instrument.instrumented(bars=instrument.first_arg_len)
+    def bearish_engulfing(df, ema):
+        return masks_succ_rate(*VecStrats.bearish_engulfing_masks(df, ema))
+    
+    
+    @instrument.instrumented(bars=instrument.first_arg_len)
+    def piercing(df, ema):
+        return masks_succ_rate(*VecStrats.piercing_masks(df, ema))
+    
+    
+    @instrument.instrumented(bars=instrument.first_arg_len)
+    def dark_cloud_cover(df, ema):
+        return masks_succ_rate(*VecStrats.dark_cloud_cover_masks(df, ema))
+    
+    
+    @instrument.instrumented(bars=instrument.first_arg_len)
+    def hammer(df, ema):
+        return masks_succ_rate(*VecStrats.hammer_masks(df, ema))
+    
+    
+    @instrument.instrumented(bars=instrument.first_arg_len)
+    def shooting_star(df, ema):
+        return masks_succ_rate(*VecStrats.shooting_star_masks(df, ema))
@@ -0,0 +1,121 @@
+import csv
+from collections import deque, namedtuple
+
+import numpy as np
+
+import stoks
+
+
+# Something that happened while streaming candles.
+# kind is 'hit' when a strat occurs, then 'succ' or 'fail' once its outcome is known.
+# date is the date the strat is dated on (its first candle) and index is that
+# candle's position in the stream.
+StreamEvent = namedtuple('StreamEvent', ['kind', 'date', 'pattern', 'direction', 'index'])
+
+
+# Finds strats in candles as they come in, one at a time (or a few at a time),
+# instead of needing every candle up front.
+# The ema is updated from the last one, only the last few candles are kept, and a
+# strat's outcome is decided 2 candles after its last candle like is_succ() does,
+# so the memory used stays the same no matter how long the stream runs.
+#
+# The window is one candle longer than the longest strat, so its trend can be found.
+# The events match scan() on the same candles, except that the first candle has
+# no trend before it here (scan() compares it to the last candle like downtrend()
+# does), and strats near the end of the stream are still waiting for an outcome.
+class StreamScanner:
+    def __init__(self, pds_to_incl=9, doji_limit=stoks.DOJI_LIMIT, patterns=None):
+        if (patterns is None):
+            patterns = list(stoks.PATTERNS)
+
+        self.patterns = [stoks.PATTERNS[name] for name in patterns]
+        self.smooth = 2 / (pds_to_incl + 1)
+        self.doji_limit = doji_limit
+
+        # The number of candles seen so far.
+        self.index = 0
+
+        # The last few candles, oldest first. Each is a list of
+        # [date, open, high, low, close, ema, type, name].
+        self.window_size = max(pattern.num_candles for pattern in self.patterns) + 1
+        self.window = deque(maxlen=self.window_size)
+
+        # Strats waiting for their outcome, as [candle index to decide on, ema to
+        # compare against, hit event].
+        self.pending = deque()
+
+
+    # Adds one candle (a dict, dataframe row, or anything with Date, Open, High,
+    # Low, and Close) and returns the list of events it caused.
+    def update(self, bar):
+        o, h, l, c = (float(bar[col]) for col in ('Open', 'High', 'Low', 'Close'))
+
+        # The first ema will just be the first candle's closing price.
+        if (self.window):
+            ema = (c * self.smooth) + (self.window[-1][5] * (1-self.smooth))
+        else:
+            ema = c
+
+        types, names = stoks.classify_candles(*(np.array([x]) for x in (o, h, l, c)), self.doji_limit)
+        self.window.append([bar['Date'], o, h, l, c, ema, types[0], names[0]])
+
+        events = self._resolve(ema)
+        events += self._find_hits(ema)
+        self.index += 1
+        return events
+
+
+    # Adds several candles and yields the events they cause as they happen.
+    def update_many(self, bars):
+        for bar in bars:
+            yield from self.update(bar)
+
+
+    # Decides the outcome of every pending strat that ends 2 candles before this one.
+    def _resolve(self, ema):
+        events = []
+        while (self.pending and self.pending[0][0] == self.index):
+            when, ref_ema, hit = self.pending.popleft()
+            if (hit.direction == 'bull'):
+                succ = ema > ref_ema
+            else:
+                succ = ema < ref_ema
+            events.append(hit._replace(kind='succ' if succ else 'fail'))
+        return events
+
+
+    # Runs the strats over the window and records any that end on this candle.
+    def _find_hits(self, ema):
+        # Pads the start of the stream with empty candles, which never match anything.
+        rows = [[None] + [np.nan] * 5 + [stoks.EMPTY, stoks.IDK]] * (self.window_size - len(self.window))
+        rows += list(self.window)
+        cols = list(zip(*rows))
+        arr = stoks.ScanArrays(*(np.array(col, dtype=float) for col in cols[1:6]),
+                               np.array(cols[6], dtype=np.int8), np.array(cols[7], dtype=np.int8))
+
+        events = []
+        for pattern in self.patterns:
+            # Outcomes are handled by _resolve(), so only the conditions are checked.
+            matches = pattern.matches(arr)
+            # The window position of the strat's first candle.
+            first = self.window_size - pattern.num_candles
+            if (matches[first]):
+                hit = StreamEvent('hit', rows[first][0], pattern.name, pattern.direction,
+                                  self.index - (pattern.num_candles - 1))
+                events.append(hit)
+                self.pending.append([self.index + 2, ema, hit])
+        return events
+
+
+# Reads candles from a csv file (like one saved with df.to_csv()) one row at a
+# time, so even a huge file can be replayed with a StreamScanner.
+def replay_csv(path):
+    with open(path, newline='') as file:
+        for row in csv.DictReader(file):
+            yield row
+
+
+# Runs a StreamScanner over candles and yields the events as they happen.
+def stream(bars, pds_to_incl=9, doji_limit=stoks.DOJI_LIMIT, patterns=None):
+    scanner = StreamScanner(pds_to_incl, doji_limit, patterns)
+    yield from scanner.update_many(bars)
@@ -0,0 +1,104 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import stoks
+
+
+# The values swept by default: doji limits around the 10% to 14% candle_type()
+# recommends, common ema periods, and outcomes decided 1 to 5 candles later.
+DOJI_LIMITS = [0.10, 0.11, 0.12, 0.13, 0.14]
+EMA_PERIODS = [5, 9, 12, 20, 26, 50]
+HORIZONS = [1, 2, 3, 5]
+
+
+# The results of a sweep. counts and succ_counts are arrays with one axis per
+# parameter and one for the strats, shaped
+# (len(doji_limits), len(ema_periods), len(horizons), len(patterns)).
+class SweepResult:
+    def __init__(self, doji_limits, ema_periods, horizons, patterns, counts, succ_counts):
+        self.doji_limits = list(doji_limits)
+        self.ema_periods = list(ema_periods)
+        self.horizons = list(horizons)
+        self.patterns = list(patterns)
+        self.counts = counts
+        self.succ_counts = succ_counts
+
+
+    # The success rate of every strat at every grid point (nan if it never occurs).
+    def succ_rates(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.succ_counts / self.counts
+
+
+    # The results as a dataframe with a row per grid point and strat.
+    def to_frame(self):
+        index = pd.MultiIndex.from_product(
+            [self.doji_limits, self.ema_periods, self.horizons, self.patterns],
+            names=['Doji Limit', 'EMA Periods', 'Horizon', 'Strat'])
+        return pd.DataFrame({'Count': self.counts.ravel(), 'Successes': self.succ_counts.ravel(),
+                             'Success Rate': self.succ_rates().ravel()}, index=index)
+
+
+    # The grid point with the highest success rate for a strat, out of the ones
+    # where it occurred at least min_count times. Returns (doji limit, ema periods,
+    # horizon, success rate), or None if no grid point has enough occurrences.
+    def best(self, pattern, min_count=1):
+        p = self.patterns.index(pattern)
+        rates = np.where(self.counts[..., p] >= min_count, self.succ_rates()[..., p], -1.0)
+        if (np.max(rates) < 0):
+            return None
+        i, j, k = np.unravel_index(np.argmax(rates), rates.shape)
+        return self.doji_limits[i], self.ema_periods[j], self.horizons[k], float(rates[i, j, k])
+
+
+# Counts every strat at every doji limit and horizon for one ema.
+# The candle shapes and names are worked out before this and shared, and for each
+# horizon the ScanArrays is only built once, with just the candle types swapped
+# out for each doji limit.
+def _sweep_ema(o, h, l, c, ema, types_per_limit, names, horizons, patterns):
+    counts = np.zeros((len(types_per_limit), len(horizons), len(patterns)), dtype=np.int64)
+    succ_counts = np.zeros_like(counts)
+
+    for k, horizon in enumerate(horizons):
+        arr = stoks.ScanArrays(o, h, l, c, ema, types_per_limit[0], names, horizon)
+        for i, types in enumerate(types_per_limit):
+            arr.set_types(types)
+            for p, name in enumerate(patterns):
+                hits, succ = stoks.PATTERNS[name].masks(arr)
+                counts[i, k, p] = np.count_nonzero(hits)
+                succ_counts[i, k, p] = np.count_nonzero(succ)
+
+    return counts, succ_counts
+
+
+# Runs every strat on df over every combination of doji limit, ema periods, and
+# horizon (how many candles later a strat's outcome is decided).
+# The candle shapes and every ema are worked out once up front. With more than one
+# worker, the ema periods are split across a pool of processes.
+def sweep(df, doji_limits=DOJI_LIMITS, ema_periods=EMA_PERIODS, horizons=HORIZONS,
+          patterns=None, workers=1):
+    if (patterns is None):
+        patterns = list(stoks.PATTERNS)
+
+    o, h, l, c = stoks.ohlc_arrays(df)
+    shapes = stoks.candle_shapes(o, h, l, c)
+    names = stoks.classify_names(shapes)
+    types_per_limit = [stoks.classify_types(o, c, shapes, limit) for limit in doji_limits]
+
+    # Every ema in one call, a row per number of periods.
+    emas = stoks.ema_array(c, list(ema_periods))
+
+    jobs = [(o, h, l, c, ema, types_per_limit, names, list(horizons), list(patterns)) for ema in emas]
+    if (workers == 1):
+        outputs = [_sweep_ema(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(_sweep_ema, *zip(*jobs)))
+
+    # Puts the ema periods axis second.
+    counts = np.stack([counts for counts, succ_counts in outputs], axis=1)
+    succ_counts = np.stack([succ_counts for counts, succ_counts in outputs], axis=1)
+    return SweepResult(doji_limits, ema_periods, horizons, patterns, counts, succ_counts)
+
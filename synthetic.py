@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+
+# Makes fake stock data shaped like get_stock_data()'s, without needing the internet.
+# The same num_candles and seed always give the same data.
+# The closes are a random walk, with shadows above and below each body, and every
+# so often a doji or an empty candle (open, high, low, and close all the same) so
+# every type of candle shows up.
+# freq is how far apart the candles are ('B' for business days, 'min' for minutes);
+# over about 60,000 daily candles the dates would pass the year 2262, which
+# pandas can't store, so 'min' is needed for huge amounts of data.
+def synthetic_stock_data(num_candles, seed=0, start_price=100.0, volatility=0.02,
+                         start_date='2000-01-03', freq='B'):
+    rng = np.random.default_rng(seed)
+
+    close = start_price * np.exp(np.cumsum(rng.normal(0, volatility, num_candles)))
+    open_ = close * np.exp(rng.normal(0, volatility / 2, num_candles))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, volatility / 2, num_candles)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, volatility / 2, num_candles)))
+
+    # Some dojis and empty candles.
+    open_[::50] = close[::50]
+    high[::997] = low[::997] = open_[::997] = close[::997]
+
+    return pd.DataFrame({
+        'Date': pd.date_range(start_date, periods=num_candles, freq=freq),
+        'Open': open_,
+        'High': high,
+        'Low': low,
+        'Close': close,
+        'Adj Close': close,
+        'Volume': rng.integers(100_000, 10_000_000, num_candles),
+    })
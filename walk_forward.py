@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+import stoks
+
+
+# Dates as datetime64. Compact data (see stoks.compact_stock_data()) stores them as
+# int64 nanoseconds, which would otherwise be read as a count of months or days.
+def _as_dates(dates):
+    dates = np.asarray(dates)
+    return dates if dates.dtype.kind == 'M' else dates.astype('datetime64[ns]')
+
+
+# The rows each window ends on (not including), stepping through num_candles
+# candles. step is a number of candles, or 'M' to end a window at the end of
+# every month (which needs dates).
+def window_ends(num_candles, window, step, dates=None):
+    if (step == 'M'):
+        months = _as_dates(dates).astype('datetime64[M]')
+        # The rows where the month changes, plus the end of the data.
+        ends = np.append(np.flatnonzero(months[1:] != months[:-1]) + 1, num_candles)
+    else:
+        ends = np.arange(num_candles, 0, -step)[::-1]
+    # Only keeps windows with enough candles before them.
+    return ends[ends >= window]
+
+
+# The success rate of every strat in a ScanResult over rolling windows of
+# window candles, one window ending every step candles (or every month if step is 'M').
+# If anchored is True, every window starts at the first candle instead (a walk
+# forward test that uses all the data up to each point).
+#
+# by decides which window a strat counts in:
+#   'resolved' - the window with the candle its outcome is decided on (its last
+#                candle plus the scan's horizon), so a window only uses outcomes
+#                that were known by its end.
+#                This is the one to use for walk forward tests.
+#   'start'    - the window with the candle it's dated on, even though its outcome
+#                depends on candles after the window ends.
+# horizon defaults to the one the scan used (result.horizon), and giving a
+# different one raises a ValueError since the windows would be wrong.
+#
+# Running the strats again for each window would take (windows x candles) time.
+# Instead the hits and successes of each strat are added up once, then the count
+# in any window is just the difference of two of those running totals.
+#
+# Returns a dataframe indexed by the date of the last candle in each window, with
+# 'Count', 'Successes', and 'Success Rate' (nan if the strat didn't occur) columns
+# for each strat.
+def rolling_succ_rates(result, window=250, step=21, anchored=False, by='resolved', horizon=None):
+    if (by not in ('resolved', 'start')):
+        raise ValueError(f"by must be 'resolved' or 'start', not {by!r}")
+    if (horizon is None):
+        horizon = result.horizon
+    elif (horizon != result.horizon):
+        raise ValueError(f'horizon is {horizon} but the scan used a horizon of {result.horizon}')
+    names = list(result.masks)
+    num_candles = len(result.dates)
+    dates = _as_dates(result.dates)
+
+    hits = np.zeros((num_candles, len(names)), dtype=bool)
+    succ = np.zeros_like(hits)
+    for k, name in enumerate(names):
+        # How many candles after its first candle each strat's outcome is decided.
+        delay = stoks.PATTERNS[name].num_candles - 1 + horizon if by == 'resolved' else 0
+        hits[delay:, k] = result.masks[name][0][:num_candles - delay]
+        succ[delay:, k] = result.masks[name][1][:num_candles - delay]
+
+    # Running totals of hits and successes, with a 0 in front so
+    # totals[end] - totals[start] is the count in rows [start, end).
+    hit_totals = np.zeros((num_candles + 1, len(names)), dtype=np.int64)
+    succ_totals = np.zeros_like(hit_totals)
+    np.cumsum(hits, axis=0, out=hit_totals[1:])
+    np.cumsum(succ, axis=0, out=succ_totals[1:])
+
+    ends = window_ends(num_candles, window, step, dates)
+    starts = np.zeros_like(ends) if anchored else ends - window
+
+    counts = hit_totals[ends] - hit_totals[starts]
+    succ_counts = succ_totals[ends] - succ_totals[starts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = succ_counts / counts
+
+    index = pd.Index(dates[ends - 1], name='Date')
+    return pd.concat({
+        'Count': pd.DataFrame(counts, index=index, columns=names),
+        'Successes': pd.DataFrame(succ_counts, index=index, columns=names),
+        'Success Rate': pd.DataFrame(rates, index=index, columns=names),
+    }, axis=1)
+
+
+# rolling_succ_rates() for many tickers at once, from a dict of ticker to ScanResult.
+# Returns one dataframe indexed by ticker and date.
+def rolling_succ_rates_many(results, window=250, step=21, anchored=False, by='resolved', horizon=None):
+    frames = {ticker: rolling_succ_rates(result, window, step, anchored, by, horizon)
+              for ticker, result in results.items()}
+    return pd.concat(frames, names=['Ticker'])